@@ -1,4 +1,3 @@
-import json
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from pathlib import Path
@@ -119,6 +118,13 @@ class AgentState(TypedDict):
 # Dynamic Prompt Middleware
 # ==========================
 
+_MSK_TZ = ZoneInfo("Europe/Moscow")
+
+# Дни недели по datetime.weekday() (0 = понедельник); не зависит от локали strftime("%A")
+_WEEKDAYS_RU = (
+    "Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье",
+)
+
 @dynamic_prompt
 def build_agent_prompt(req: ModelRequest) -> str:
     """
@@ -128,14 +134,9 @@ def build_agent_prompt(req: ModelRequest) -> str:
     state = req.state
 
     # Устанавливаем часовой пояс МСК (UTC+3)
-    current_time = datetime.now(ZoneInfo("Europe/Moscow"))
+    current_time = datetime.now(_MSK_TZ)
     current_time_str = current_time.strftime("%H:%M")
-    weekday = current_time.strftime("%A")
-    weekday_ru = {
-        "Monday": "Понедельник", "Tuesday": "Вторник", "Wednesday": "Среда",
-        "Thursday": "Четверг", "Friday": "Пятница", "Saturday": "Суббота",
-        "Sunday": "Воскресенье"
-    }.get(weekday, weekday)
+    weekday_ru = _WEEKDAYS_RU[current_time.weekday()]
 
     # Извлекаем метаданные пользователя для персонализации
     user_info = state.get("user_info", {})
@@ -6,11 +6,12 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from schemas.service_schemas import HealthResponse
 import asyncio
-import json
+import orjson
 from pathlib import Path
 
 # Настройка логирования
 from utils.logger import setup_logging
+from utils.gzip_request import GzipRequestMiddleware
 logger = setup_logging("api")
 
 # Импорт роутеров
@@ -39,24 +40,47 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Бот присылает историю диалога сжатой (Content-Encoding: gzip) - распаковываем до роутеров
+app.add_middleware(GzipRequestMiddleware)
+
 # Подключаем роутеры
 app.include_router(ai_router)
 app.include_router(crm_router)
 
 
-async def periodic_catalog_sync():
+async def warm_catalog_snapshot():
     """
-    Периодическая синхронизация каталога из 1C каждый час.
+    Загружает каталог из Redis в кеш процесса, чтобы первый вызов
+    search_products_tool не платил за чтение и разбор всего каталога.
     """
+    from tools.product_search_bm25 import load_catalog_snapshot
+
+    try:
+        # Версию проверяем сразу: прогрев идет и сразу после синхронизации
+        await asyncio.to_thread(load_catalog_snapshot, recheck_version=True)
+    except Exception as e:
+        logger.warning(f"⚠️  Catalog warm-up failed: {e}")
+
+
+async def sync_catalog_and_warm():
+    """Синхронизация каталога из 1C и прогрев кеша каталога новыми данными."""
     from services.catalog_sync import catalog_sync_service
 
+    await catalog_sync_service.sync_catalog()
+    await warm_catalog_snapshot()
+
+
+async def periodic_catalog_sync():
+    """
+    Периодическая синхронизация каталога из 1C каждый час.
+    """
     # Задержка перед первым запуском (даем время на старт сервиса)
     await asyncio.sleep(60)
 
     while True:
         try:
             logger.info("🔄 Starting periodic catalog sync...")
-            await catalog_sync_service.sync_catalog()
+            await sync_catalog_and_warm()
         except Exception as e:
             logger.error(f"❌ Error in periodic catalog sync: {e}", exc_info=True)
 
@@ -108,8 +132,7 @@ async def startup_event():
                     kb_content = {}
                 else:
                     try:
-                        with open(kb_path, "r", encoding="utf-8") as f:
-                            kb_content = json.load(f)
+                        kb_content = orjson.loads(kb_path.read_bytes())
                         logger.info(f"Загружена база знаний из {kb_path.name}")
                     except Exception as e:
                         logger.error(f"Ошибка загрузки базы знаний: {e}")
@@ -130,11 +153,13 @@ async def startup_event():
         logger.error(f"Ошибка при инициализации дефолтных значений: {e}", exc_info=True)
         # Не падаем, если не удалось загрузить - возможно БД еще не готова
 
+    # Прогреваем кеш каталога тем, что уже лежит в Redis с прошлой синхронизации
+    asyncio.create_task(warm_catalog_snapshot())
+
     # Запускаем первую синхронизацию каталога из 1C
     try:
-        from services.catalog_sync import catalog_sync_service
         logger.info("🚀 Starting initial catalog sync from 1C...")
-        asyncio.create_task(catalog_sync_service.sync_catalog())
+        asyncio.create_task(sync_catalog_and_warm())
         logger.info("✅ Initial catalog sync task created")
     except Exception as e:
         logger.error(f"❌ Error starting initial catalog sync: {e}", exc_info=True)
@@ -147,6 +172,15 @@ async def startup_event():
         logger.error(f"❌ Error starting periodic sync task: {e}", exc_info=True)
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Закрывает общие клиенты синхронизации каталога."""
+    from services.catalog_sync import catalog_sync_service
+
+    await catalog_sync_service.close_http_client()
+    await catalog_sync_service.close_redis()
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint."""
@@ -3,11 +3,17 @@ Telegram бот для консультанта по продажам.
 Подключается к FastAPI микросервису для обработки сообщений через AI агента.
 """
 import asyncio
+import gzip
+import importlib.util
+import logging
 import time
+import weakref
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Any
+from typing import Dict, Final, List, Optional, Any
 from chatgpt_md_converter import telegram_format
 from utils.logger import setup_logging
+from utils.memory_storage import BoundedMemoryStorage
+from utils.telegram_rate_limit import TelegramRateLimitMiddleware
 from dotenv import load_dotenv
 from os import getenv
 import httpx
@@ -15,7 +21,7 @@ from schemas.service_schemas import MessageResponse, MessageRequest
 
 from aiogram import Bot, Dispatcher
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.types import Message, User
 from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.enums import ChatAction
@@ -26,13 +32,99 @@ load_dotenv()
 # Конфигурация
 TOKEN = getenv("BOT_TOKEN")
 API_URL = getenv("API_URL", "http://localhost:5537")
-
-# Хранилище контекста диалогов (в продакшене использовать Redis или БД)
-storage = RedisStorage.from_url(getenv("REDIS_URL"))
+# HTTP/2 к AI сервису: мультиплексирование запросов пользователей в одном соединении.
+# httpx включает h2 только через TLS (ALPN), поэтому имеет смысл при https API_URL
+AI_API_HTTP2 = getenv("AI_API_HTTP2", "false").lower() == "true"
+# Сжатие тела POST /chat (история диалога) gzip'ом; API распаковывает его в GzipRequestMiddleware.
+# Маленькие запросы отправляются как есть - сжатие не окупается
+AI_API_GZIP = getenv("AI_API_GZIP", "true").lower() == "true"
+AI_API_GZIP_MIN_BYTES = 1024
+
+# Срок жизни контекста диалога в Redis: каждое сообщение продлевает его,
+# брошенные диалоги удаляются сами, а не копятся по всем пользователям навсегда
+BOT_CONTEXT_TTL_SECONDS = int(getenv("BOT_CONTEXT_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Без Redis - контексты в памяти процесса, не больше стольких пользователей (LRU)
+BOT_MEMORY_CONTEXTS_MAX = int(getenv("BOT_MEMORY_CONTEXTS_MAX", "10000"))
+
+# Хранилище контекста диалогов: FSM data пользователя в Redis (общий пул соединений)
+REDIS_URL = getenv("REDIS_URL")
+if REDIS_URL:
+    storage = RedisStorage.from_url(
+        REDIS_URL,
+        connection_kwargs={"max_connections": 50},
+        state_ttl=BOT_CONTEXT_TTL_SECONDS,
+        data_ttl=BOT_CONTEXT_TTL_SECONDS,
+    )
+else:
+    logger.warning("REDIS_URL is not set - dialog contexts are kept in memory and lost on restart")
+    storage = BoundedMemoryStorage(maxsize=BOT_MEMORY_CONTEXTS_MAX, ttl=BOT_CONTEXT_TTL_SECONDS)
 # Инициализация бота и диспетчера
 bot = Bot(token=TOKEN)
+# Все исходящие вызовы Bot API (answer/reply/"печатает...") проходят через лимиты Telegram
+bot.session.middleware(TelegramRateLimitMiddleware())
 dp = Dispatcher(storage=storage)
 
+# Общий HTTP клиент к AI сервису (создается лениво, закрывается в on_shutdown)
+_ai_client: Optional[httpx.AsyncClient] = None
+AI_MAX_KEEPALIVE_CONNECTIONS = 20
+AI_KEEPALIVE_EXPIRY_SECONDS = 30.0
+# Сколько соединений пула держать "прогретыми" (TCP/TLS уже установлен) для первых сообщений
+AI_WARM_CONNECTIONS = AI_MAX_KEEPALIVE_CONNECTIONS // 4
+# Пинг /health после простоя дольше стольких секунд (меньше keepalive_expiry - соединение
+# не успевает истечь); 0 - выключено, соединение после простоя открывается заново
+AI_KEEPALIVE_PING_SECONDS = float(getenv("AI_KEEPALIVE_PING_SECONDS", "0"))
+_warmup_task: Optional[asyncio.Task] = None
+# Время последнего обращения к AI сервису (time.monotonic)
+_last_ai_activity = 0.0
+
+
+def get_ai_client() -> httpx.AsyncClient:
+    """
+    HTTP клиент к AI сервису с keep-alive и пулом соединений.
+
+    Переиспользуется всеми сообщениями вместо нового клиента (и TCP-подключения)
+    на каждый запрос.
+    """
+    global _ai_client
+    if _ai_client is None or _ai_client.is_closed:
+        http2 = AI_API_HTTP2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("AI_API_HTTP2=true, but package h2 is not installed - using HTTP/1.1")
+            http2 = False
+        _ai_client = httpx.AsyncClient(
+            base_url=API_URL,
+            http2=http2,
+            timeout=httpx.Timeout(120.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=AI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=AI_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+        )
+    return _ai_client
+
+
+async def close_ai_client() -> None:
+    """Закрытие HTTP клиента к AI сервису."""
+    global _ai_client
+    if _ai_client is not None:
+        await _ai_client.aclose()
+        _ai_client = None
+
+
+# Лок на чат: проверка и установка processing_message_id выполняются атомарно.
+# WeakValueDictionary - лок живет, пока его держит хотя бы один обработчик
+_chat_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def get_chat_lock(chat_id: int) -> asyncio.Lock:
+    """Лок обработки сообщений одного чата."""
+    lock = _chat_locks.get(chat_id)
+    if lock is None:
+        lock = _chat_locks[chat_id] = asyncio.Lock()
+    return lock
+
 
 async def send_typing_with_event(
     bot: Bot, 
@@ -69,6 +161,7 @@ async def ai_request(
     Returns:
         Ответ от AI агента
     """
+    global _last_ai_activity
     try:
         # Формируем запрос
         request = MessageRequest(
@@ -80,15 +173,21 @@ async def ai_request(
         )
         
         # Отправляем запрос в AI сервис
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                f"{API_URL}/chat",
-                json=request.model_dump()
-            )
-            response.raise_for_status()
-            logger.info(f"AI service response: \n{response}")
-            result = MessageResponse.model_validate(response.json())
-            return result
+        body = request.model_dump_json().encode()
+        headers = {"Content-Type": "application/json"}
+        if AI_API_GZIP and len(body) >= AI_API_GZIP_MIN_BYTES:
+            # Уровень 6: почти тот же размер, что и 9, но заметно быстрее
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        _last_ai_activity = time.monotonic()
+        response = await get_ai_client().post("/chat", content=body, headers=headers)
+        response.raise_for_status()
+        # Ответ с updated_context бывает большим - в лог только начало сырых байт
+        if logger.isEnabledFor(logging.INFO):
+            preview = response.content[:500].decode("utf-8", errors="replace")
+            logger.info("AI service response: \n%s...", preview)
+        result = MessageResponse.model_validate_json(response.content)
+        return result
     
     except httpx.HTTPStatusError as e:
         logger.error(f"HTTP error when calling AI service for user {user_id}: {e.response.status_code} - {e}")
@@ -103,44 +202,60 @@ async def ai_request(
         return MessageResponse(response="Извините, сервис временно недоступен. Попробуйте позже.")
 
 
+# Тексты команд собираются один раз при импорте, а не на каждый вызов обработчика.
+# Приветствие в markdown - конвертируется в Telegram HTML тоже один раз
+WELCOME_TEXT: Final[str] = telegram_format(
+    "Здравствуйте! Я ИИ-ассистент компании *СтройАссортимент*\n\n"
+    "Я могу помочь вам:\n"
+    "✅ Подобрать строительные материалы по вашим требованиям\n"
+    "✅ Оформить заказ прямо здесь в чате\n"
+    "✅ Ответить на вопросы о товарах, доставке и оплате\n"
+    "✅ Связать вас с живым менеджером, если нужна консультация\n\n"
+    "📦 *Основные категории:*\n"
+    "• Пиломатериалы\n"
+    "• Листовые материалы\n"
+    "• Изоляционные материалы\n"
+    "• Метизы и антисептики\n\n"
+    "🏭 Собственное производство • 🚚 Доставка по Москве и МО\n\n"
+    "📞 *Контакты:*\n"
+    "Телефон: +7 (499) 302-55-01\n"
+    "Email: info@stroyassortiment.ru\n"
+    "Режим работы: Ежедневно с 8:00 до 19:00\n\n"
+    "💬 Просто напишите, что вас интересует, и я помогу!"
+)
+
+HELP_TEXT: Final[str] = (
+    "📋 <b>Доступные команды:</b>\n\n"
+    "/start - Начать диалог\n"
+    "/clear - Очистить историю диалога\n"
+    "/help - Показать эту справку\n\n"
+    "Просто напишите ваш вопрос, и я помогу вам с выбором товаров, "
+    "информацией о доставке, оплате и других вопросах!"
+)
+
+
+def user_metadata(user: User) -> Dict[str, Any]:
+    """Данные профиля пользователя Telegram для персонализации ответов агента."""
+    return {
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "username": user.username,
+        "language_code": user.language_code,
+        "channel": "telegram"
+    }
+
+
 @dp.message(Command("start"))
 async def command_start_handler(message: Message, state: FSMContext) -> None:
     """Обработчик команды /start"""
-    welcome_text = (
-        "Здравствуйте! Я ИИ-ассистент компании *СтройАссортимент*\n\n"
-        "Я могу помочь вам:\n"
-        "✅ Подобрать строительные материалы по вашим требованиям\n"
-        "✅ Оформить заказ прямо здесь в чате\n"
-        "✅ Ответить на вопросы о товарах, доставке и оплате\n"
-        "✅ Связать вас с живым менеджером, если нужна консультация\n\n"
-        "📦 *Основные категории:*\n"
-        "• Пиломатериалы\n"
-        "• Листовые материалы\n"
-        "• Изоляционные материалы\n"
-        "• Метизы и антисептики\n\n"
-        "🏭 Собственное производство • 🚚 Доставка по Москве и МО\n\n"
-        "📞 *Контакты:*\n"
-        "Телефон: +7 (499) 302-55-01\n"
-        "Email: info@stroyassortiment.ru\n"
-        "Режим работы: Ежедневно с 8:00 до 19:00\n\n"
-        "💬 Просто напишите, что вас интересует, и я помогу!"
-    )
-    welcome_text = telegram_format(welcome_text)
-    await message.answer(welcome_text, parse_mode="HTML")  
+    await message.answer(WELCOME_TEXT, parse_mode="HTML")
 
-    data = await state.get_data()
     await state.update_data(
         processing_message_id=None,
         user_id=message.from_user.id, 
         chat_id=message.chat.id, 
         context=[],
-        metadata={
-            "first_name": message.from_user.first_name,
-            "last_name": message.from_user.last_name,
-            "username": message.from_user.username,
-            "language_code": message.from_user.language_code,
-            "channel": "telegram"
-        }
+        metadata=user_metadata(message.from_user)
     )
 
 @dp.message(Command("clear"))
@@ -152,36 +267,34 @@ async def command_clear_handler(message: Message, state: FSMContext) -> None:
 @dp.message(Command("help"))
 async def command_help_handler(message: Message) -> None:
     """Обработчик команды /help"""
-    help_text = (
-        "📋 <b>Доступные команды:</b>\n\n"
-        "/start - Начать диалог\n"
-        "/clear - Очистить историю диалога\n"
-        "/help - Показать эту справку\n\n"
-        "Просто напишите ваш вопрос, и я помогу вам с выбором товаров, "
-        "информацией о доставке, оплате и других вопросах!"
-    )
-    await message.reply(help_text, parse_mode="HTML")
+    await message.reply(HELP_TEXT, parse_mode="HTML")
 
 
 @dp.message()
 async def handle_message(message: Message, state: FSMContext) -> None:
     """Обработчик всех текстовых сообщений"""
+    # Флаг processing_message_id сбрасывает только тот обработчик, который его установил
+    owns_processing = False
     try:
-        data = await state.get_data()
-
-        # Если пользователь уже обрабатывается, отправляем сообщение о том, что мы уже обрабатываем его сообщение
-        if data.get("processing_message_id"):
-            await message.reply(
-                "Я уже обрабатываю вот это сообщение. Отправьте его снова после того, как я закончу с вашим текущим сообщением.", 
-                parse_mode="HTML",
-                reply_to_message_id=data.get("processing_message_id")
+        # Aiogram обрабатывает апдейты параллельно: без лока два быстрых сообщения
+        # одного пользователя оба видят пустой флаг и затирают контекст друг друга
+        async with get_chat_lock(message.chat.id):
+            data = await state.get_data()
+
+            # Если пользователь уже обрабатывается, отправляем сообщение о том, что мы уже обрабатываем его сообщение
+            if data.get("processing_message_id"):
+                await message.reply(
+                    "Я уже обрабатываю вот это сообщение. Отправьте его снова после того, как я закончу с вашим текущим сообщением.", 
+                    parse_mode="HTML",
+                    reply_to_message_id=data.get("processing_message_id")
+                )
+                return
+
+            # Обновляем состояние для отслеживания текущего сообщения
+            await state.update_data(
+                processing_message_id=message.message_id,
             )
-            return
-        
-        # Обновляем состояние для отслеживания текущего сообщения
-        await state.update_data(
-            processing_message_id=message.message_id,
-        ) 
+            owns_processing = True
 
         # Запускаем процесс отправки сообщения "печатается..."
         stop_typing_event = asyncio.Event()
@@ -200,13 +313,7 @@ async def handle_message(message: Message, state: FSMContext) -> None:
         user = message.from_user
         user_id = user.id
         chat_id = message.chat.id
-        metadata = {
-            "first_name": user.first_name,
-            "last_name": user.last_name,
-            "username": user.username,
-            "language_code": user.language_code,
-            "channel": "telegram"
-        }
+        metadata = user_metadata(user)
 
 
         # Запускаем процесс отправки сообщения "печатается..."
@@ -256,34 +363,66 @@ async def handle_message(message: Message, state: FSMContext) -> None:
             typing_task.cancel()
         await message.reply("Извините, произошла ошибка. Попробуйте позже.")
     finally:
-        await state.update_data(
-            processing_message_id=None,
-        )
+        if owns_processing:
+            await state.update_data(
+                processing_message_id=None,
+            )
 
 async def check_api_health() -> bool:
     """Проверяет доступность AI сервиса"""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{API_URL}/health")
-            return response.status_code == 200
+        response = await get_ai_client().get("/health", timeout=5.0)
+        return response.status_code == 200
     except Exception:
         return False
 
 
+async def warm_ai_connections(count: int = AI_WARM_CONNECTIONS) -> int:
+    """
+    Открывает count соединений пула к AI сервису параллельными /health запросами
+    (одновременные запросы идут по разным соединениям, после ответа остаются в пуле).
+
+    Returns:
+        Сколько запросов прошло успешно
+    """
+    results = await asyncio.gather(*(check_api_health() for _ in range(count)))
+    return sum(results)
+
+
+async def keep_ai_connections_warm() -> None:
+    """Один /health, только если к AI сервису не обращались AI_KEEPALIVE_PING_SECONDS секунд."""
+    global _last_ai_activity
+    while True:
+        idle = time.monotonic() - _last_ai_activity
+        if idle < AI_KEEPALIVE_PING_SECONDS:
+            await asyncio.sleep(AI_KEEPALIVE_PING_SECONDS - idle)
+            continue
+        _last_ai_activity = time.monotonic()
+        await check_api_health()
+
+
 async def on_startup():
     """Выполняется при запуске бота"""
     logger.info("Bot is starting...")
     
-    # Проверяем доступность AI сервиса
-    if await check_api_health():
-        logger.info(f"AI service is available at {API_URL}")
+    # Проверяем доступность AI сервиса и заодно прогреваем пул соединений
+    warmed = await warm_ai_connections()
+    if warmed:
+        logger.info(f"AI service is available at {API_URL} ({warmed} connections warmed)")
     else:
         logger.warning(f"AI service is not available at {API_URL}. Bot will still start but may fail.")
 
+    global _warmup_task
+    if AI_KEEPALIVE_PING_SECONDS > 0:
+        _warmup_task = asyncio.create_task(keep_ai_connections_warm())
+
 
 async def on_shutdown():
     """Выполняется при остановке бота"""
     logger.info("Bot is shutting down...")
+    if _warmup_task:
+        _warmup_task.cancel()
+    await close_ai_client()
 
 
 async def main() -> None:
@@ -299,7 +438,12 @@ async def main() -> None:
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        # uvloop (ставится вместе с uvicorn[standard]) - более быстрый цикл событий
+        from uvloop import run
+    except ImportError:
+        run = asyncio.run
+    try:
+        run(main())
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
@@ -95,6 +95,15 @@ async def init_db():
             print("Миграция leads.username успешно применена.")
         except Exception as e:
             print(f"Не удалось применить миграцию leads.username: {e}")
+
+        # Unique (channel, external_id) for race-free get_or_create_lead (INSERT ... ON CONFLICT)
+        try:
+            await conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_leads_channel_external_id ON leads (channel, external_id)"
+            ))
+            print("Миграция uq_leads_channel_external_id успешно применена.")
+        except Exception as e:
+            print(f"Не удалось применить миграцию uq_leads_channel_external_id (есть дубликаты лидов?): {e}")
     print("Таблицы успешно созданы.")
     
     # Создаем дефолтный промпт, если его еще нет
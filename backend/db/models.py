@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 from typing import Optional, List
-from sqlalchemy import String, Text, DateTime, ForeignKey, Boolean, Integer, Float, JSON
+from sqlalchemy import String, Text, DateTime, ForeignKey, Boolean, Integer, Float, JSON, UniqueConstraint
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -10,6 +10,8 @@ class Base(DeclarativeBase):
 
 class Lead(Base):
     __tablename__ = "leads"
+    # Один лид на пользователя канала (цель ON CONFLICT в get_or_create_lead)
+    __table_args__ = (UniqueConstraint("channel", "external_id", name="uq_leads_channel_external_id"),)
     
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     external_id: Mapped[Optional[str]] = mapped_column(String(255), index=True)  # ID в ТГ/Авито
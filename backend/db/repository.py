@@ -1,6 +1,8 @@
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func, and_, or_, desc
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.orm import selectinload
 from db.models import Lead, Thread, Message, AIStats, PromptConfig, User, Settings, OrderSubmission
 from typing import Optional, List, Dict
@@ -59,17 +61,41 @@ async def get_or_create_lead(
     lead = result.scalar_one_or_none()
 
     if not lead:
-        lead = Lead(
-            channel=channel,
-            external_id=external_id,
-            username=username,
-            name=name,
-            phone=phone,
-            email=email
+        # Новый лид - INSERT ... ON CONFLICT DO NOTHING RETURNING по уникальному
+        # (channel, external_id): одновременные первые сообщения не создают дубликатов,
+        # проигравший гонку запрос просто перечитывает лида
+        insert_stmt = (
+            pg_insert(Lead)
+            .values(
+                channel=channel,
+                external_id=external_id,
+                username=username,
+                name=name,
+                phone=phone,
+                email=email
+            )
+            .on_conflict_do_nothing(index_elements=["channel", "external_id"])
+            .returning(Lead)
         )
-        session.add(lead)
+        try:
+            # Savepoint: при ошибке откатывается только этот INSERT, а не
+            # несохраненные изменения вызывающего кода в общей сессии
+            async with session.begin_nested():
+                lead = (await session.execute(insert_stmt)).scalar_one_or_none()
+        except ProgrammingError:
+            # Уникальный индекс еще не создан (миграция в init_db не применилась)
+            lead = Lead(
+                channel=channel,
+                external_id=external_id,
+                username=username,
+                name=name,
+                phone=phone,
+                email=email
+            )
+            session.add(lead)
         await session.commit()
-        await session.refresh(lead)
+        if lead is None:
+            lead = (await session.execute(stmt)).scalar_one()
     else:
         # Обновляем username, name, phone, email если они пришли и изменились
         updated = False
@@ -114,18 +140,64 @@ async def save_message(
     thread_id: uuid.UUID,
     sender_role: str,
     content: str,
+    sender_id: Optional[str] = None,
+    commit: bool = True
+) -> Message:
+    """
+    Сохраняет сообщение в лог.
+
+    commit=False - только добавляет в сессию: сообщение запишется следующим
+    commit (например, вместе с ответом ИИ в save_message_with_stats).
+    """
+    message = Message(
+        thread_id=thread_id,
+        sender_role=sender_role,
+        sender_id=sender_id,
+        content=content
+    )
+    session.add(message)
+    if commit:
+        await session.commit()
+        await session.refresh(message)
+    return message
+
+async def save_message_with_stats(
+    session: AsyncSession,
+    thread_id: uuid.UUID,
+    sender_role: str,
+    content: str,
+    category: str,
+    reasoning: Optional[str] = None,
+    model_name: Optional[str] = None,
+    tokens_input: Optional[int] = None,
+    tokens_output: Optional[int] = None,
+    cost: Optional[float] = None,
+    ignored: bool = False,
     sender_id: Optional[str] = None
 ) -> Message:
-    """Сохраняет сообщение в лог."""
+    """
+    Сохраняет сообщение ИИ вместе с аналитикой одной транзакцией.
+
+    AIStats привязывается через relationship (message_id проставляется при flush),
+    поэтому хватает одного commit; id генерируются на стороне Python - refresh не нужен.
+    """
     message = Message(
         thread_id=thread_id,
         sender_role=sender_role,
         sender_id=sender_id,
         content=content
     )
+    message.ai_stats = AIStats(
+        category=category,
+        reasoning=reasoning,
+        model_name=model_name,
+        tokens_input=tokens_input,
+        tokens_output=tokens_output,
+        cost=cost,
+        ignored=ignored
+    )
     session.add(message)
     await session.commit()
-    await session.refresh(message)
     return message
 
 async def save_ai_stats(
@@ -772,6 +844,13 @@ async def get_settings(session: AsyncSession, key: str = "system") -> Optional[S
     return result.scalar_one_or_none()
 
 
+async def get_settings_updated_at(session: AsyncSession, key: str = "system") -> Optional[datetime]:
+    """Получает только время изменения настроек (без чтения value)."""
+    stmt = select(Settings.updated_at).where(Settings.key == key)
+    result = await session.execute(stmt)
+    return result.scalar_one_or_none()
+
+
 async def upsert_settings(session: AsyncSession, key: str, value: dict) -> Settings:
     """Создает или обновляет настройки."""
     existing = await get_settings(session, key)
@@ -4,8 +4,8 @@ Loads prompt and knowledge base from DB, tracks changes, and provides sync gette
 """
 import asyncio
 import hashlib
-import json
 import logging
+from datetime import datetime
 from typing import Optional
 from pathlib import Path
 
@@ -39,6 +39,7 @@ class ParamsManager:
         self._prompt_id: Optional[str] = None
         self._prompt_version: Optional[int] = None
         self._kb_hash: Optional[str] = None
+        self._kb_updated_at: Optional[datetime] = None  # Settings.updated_at загруженной KB
 
         self._initialized = True
     
@@ -99,6 +100,14 @@ class ParamsManager:
 
         return None
     
+    def _warm_kb_index(self) -> None:
+        """Токенизация и BM25 индекс KB - сразу после загрузки, вне пути запроса."""
+        try:
+            from tools.search_company_info import warm_kb_index
+            warm_kb_index(self._kb_parsed, self._kb_hash)
+        except Exception as e:
+            logger.warning(f"Не удалось построить индекс KB: {e}")
+
     def _compute_kb_hash(self, kb_text: Optional[str]) -> str:
         """Compute hash of KB text for change detection."""
         if not kb_text:
@@ -193,6 +202,8 @@ class ParamsManager:
                         self._kb_parsed = parse_text_kb(kb_text)
                         self._kb_hash = kb_hash
                         logger.info("База знаний обновлена")
+                        self._warm_kb_index()
+                    self._kb_updated_at = kb_settings.updated_at
                 else:
                     # No KB in DB, clear cache
                     if self._kb_text:
@@ -200,9 +211,14 @@ class ParamsManager:
                         self._kb_text = None
                         self._kb_parsed = None
                         self._kb_hash = None
+                    self._kb_updated_at = kb_settings.updated_at if kb_settings else None
     
     async def load_all(self, force: bool = False) -> None:
         """Load all params from DB."""
+        if force:
+            # Принудительная перезагрузка - индекс KB тоже строим заново
+            from tools.search_company_info import invalidate_kb_cache
+            invalidate_kb_cache()
         await self.load_prompt(force=force)
         await self.load_knowledge_base(force=force)
     
@@ -213,7 +229,7 @@ class ParamsManager:
         """
         try:
             from db.session import async_session_factory
-            from db.repository import get_active_prompt_config, get_settings
+            from db.repository import get_active_prompt_config, get_settings, get_settings_updated_at
         except Exception as e:
             logger.warning(f"Could not import DB helpers: {e}")
             return
@@ -242,7 +258,12 @@ class ParamsManager:
                         self._prompt_id = None
                         self._prompt_version = None
                 
-                # Check KB
+                # Check KB: сначала сверяем только updated_at (дешевый запрос),
+                # сам текст KB читаем и хешируем лишь когда запись изменилась
+                kb_updated_at = await get_settings_updated_at(session, "knowledge_base")
+                if kb_updated_at is not None and kb_updated_at == self._kb_updated_at:
+                    return
+
                 kb_settings = await get_settings(session, "knowledge_base")
                 if kb_settings and kb_settings.value:
                     # KB хранится как текст в БД
@@ -268,15 +289,20 @@ class ParamsManager:
                             self._kb_text = kb_text
                             self._kb_parsed = parse_text_kb(kb_text)
                             self._kb_hash = kb_hash
+                            self._kb_updated_at = kb_settings.updated_at
                             logger.info("База знаний обновлена")
+                            self._warm_kb_index()
                         except Exception as e:
                             logger.error(f"Ошибка парсинга KB: {e}")
+                    else:
+                        self._kb_updated_at = kb_settings.updated_at
                 else:
                     # No KB, clear if we had one
                     if self._kb_text:
                         self._kb_text = None
                         self._kb_parsed = None
                         self._kb_hash = None
+                    self._kb_updated_at = kb_settings.updated_at if kb_settings else None
     
     def get_prompt(self) -> str:
         """
@@ -305,6 +331,13 @@ class ParamsManager:
             return self._kb_parsed
         return {"metadata": {}, "sections": {}}
 
+    def get_knowledge_base_version(self) -> Optional[str]:
+        """
+        Get KB version (content hash) for caches derived from the KB.
+        Returns None if cache is empty.
+        """
+        return self._kb_hash
+
     def get_knowledge_base_for_prompt(self) -> str:
         """
         Get formatted KB summary for system prompt.
@@ -1,4 +1,5 @@
 import time
+from functools import lru_cache
 from typing import Any, Dict, Optional
 
 from db.session import async_session_factory
@@ -62,11 +63,20 @@ def get_secret_ciphertext_cached(name: str) -> Optional[str]:
     return str(v)
 
 
+@lru_cache(maxsize=32)
+def _decrypt_cached(ciphertext: str) -> str:
+    """
+    Decrypt once per ciphertext. Rotating a secret changes its ciphertext,
+    so a new value is decrypted on the next call without explicit invalidation.
+    """
+    return decrypt_secret(ciphertext)
+
+
 def get_secret_cached(name: str) -> Optional[str]:
     ct = get_secret_ciphertext_cached(name)
     if not ct:
         return None
-    return decrypt_secret(ct)
+    return _decrypt_cached(ct)
 
 
 def get_cache_snapshot() -> Dict[str, Any]:
@@ -245,6 +245,12 @@ class C1GetDetailedItemsResponse(C1BaseModel):
     items: list[C1DetailedItem] = Field(default_factory=list)
 
 
+# TypeAdapter строит схему валидации при создании - собираем их один раз,
+# а не на каждый разбор ответа 1C
+_SHORT_ITEMS_ADAPTER = TypeAdapter(list[C1ShortItem])
+_DETAILED_ITEMS_ADAPTER = TypeAdapter(list[C1DetailedItem])
+
+
 def parse_get_items_payload(payload: Any) -> list[C1ShortItem]:
     """
     1C may return either:
@@ -254,7 +260,7 @@ def parse_get_items_payload(payload: Any) -> list[C1ShortItem]:
     if isinstance(payload, dict):
         return C1GetItemsResponse.model_validate(payload).items
     if isinstance(payload, list):
-        return TypeAdapter(list[C1ShortItem]).validate_python(payload)
+        return _SHORT_ITEMS_ADAPTER.validate_python(payload)
     return []
 
 
@@ -262,7 +268,7 @@ def parse_get_detailed_items_payload(payload: Any) -> list[C1DetailedItem]:
     if isinstance(payload, dict):
         return C1GetDetailedItemsResponse.model_validate(payload).items
     if isinstance(payload, list):
-        return TypeAdapter(list[C1DetailedItem]).validate_python(payload)
+        return _DETAILED_ITEMS_ADAPTER.validate_python(payload)
     return []
 
 
@@ -2,7 +2,7 @@
 FastAPI микросервис для обработки сообщений через AI агента.
 Принимает запросы от Telegram бота и возвращает ответы агента.
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from typing import Optional
 import asyncio
 from pydantic import ValidationError
@@ -21,7 +21,7 @@ from db.repository import (
     get_or_create_lead, 
     get_or_create_thread, 
     save_message, 
-    save_ai_stats,
+    save_message_with_stats,
 )
 from schemas.service_schemas import (
     MessageRequest,
@@ -30,6 +30,7 @@ from schemas.service_schemas import (
 )
 # Настройка логирования
 from utils.logger import setup_logging
+from utils.context_window import CONTEXT_TRIM_ENABLED, trim_context
 logger = setup_logging("api")
 
 # Создаем роутер для AI эндпоинтов
@@ -63,8 +64,8 @@ async def log_interaction(request: MessageRequest, result_state: dict):
             )
             thread = await get_or_create_thread(db_session, lead.id)
 
-            # 2. Сообщение пользователя
-            await save_message(db_session, thread.id, "USER", request.message)
+            # 2. Сообщение пользователя (запишется одним commit вместе с ответом ИИ)
+            await save_message(db_session, thread.id, "USER", request.message, commit=False)
 
             # 3. Данные ответа Бота
             structured_data = result_state.get("structured_response")
@@ -74,23 +75,19 @@ async def log_interaction(request: MessageRequest, result_state: dict):
                 agent_response = getattr(structured_data, "response", "")
                 should_ignore = getattr(structured_data, "ignore", False)
 
-                # Сохраняем ответ ИИ
-                ai_msg = await save_message(
+                # Сохраняем ответ ИИ с детальной статистикой (одна транзакция)
+                await save_message_with_stats(
                     db_session,
                     thread_id=thread.id,
                     sender_role="AI",
-                    content=agent_response if not should_ignore else "[IGNORED]"
-                )
-                
-                # Сохраняем детальную статистику
-                await save_ai_stats(
-                    db_session,
-                    message_id=ai_msg.id,
+                    content=agent_response if not should_ignore else "[IGNORED]",
                     category=category,
                     reasoning=reasoning,
                     ignored=should_ignore,
                     model_name="gpt-4o-mini"
                 )
+            else:
+                await db_session.commit()
         except Exception as e:
             logger.error(f"Error in log_interaction: {e}")
 
@@ -114,6 +111,10 @@ async def chat(request: MessageRequest):
                 if isinstance(msg, BaseMessage) and not isinstance(msg, SystemMessage):
                     messages.append(msg)
 
+    # По настройке CONTEXT_TRIM_ENABLED из старых реплик убираются результаты инструментов
+    if CONTEXT_TRIM_ENABLED:
+        messages = trim_context(messages)
+
     # Добавляем новое сообщение пользователя
     messages.append(HumanMessage(content=request.message))
 
@@ -153,7 +154,7 @@ async def chat(request: MessageRequest):
     agent_response = structured_data.response.replace("—", "-")
     
     if structured_data.ignore:
-        return MessageResponse(
+        result = MessageResponse(
             response="",
             user_id=request.user_id,
             chat_id=request.chat_id,
@@ -162,13 +163,17 @@ async def chat(request: MessageRequest):
             category=structured_data.category,
             reasoning=structured_data.reasoning,
         )
-    
-    return MessageResponse(
-        response=agent_response,
-        user_id=request.user_id,
-        chat_id=request.chat_id,
-        updated_context=updated_context,
-        ignored=False,
-        category=structured_data.category,
-        reasoning=structured_data.reasoning,
-    )
+    else:
+        result = MessageResponse(
+            response=agent_response,
+            user_id=request.user_id,
+            chat_id=request.chat_id,
+            updated_context=updated_context,
+            ignored=False,
+            category=structured_data.category,
+            reasoning=structured_data.reasoning,
+        )
+
+    # Модель уже провалидирована при создании - отдаем готовый JSON, иначе FastAPI
+    # по response_model заново делает dump + validate всего updated_context
+    return Response(content=result.model_dump_json(), media_type="application/json")
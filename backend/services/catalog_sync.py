@@ -20,7 +20,11 @@ import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+import codecs
+import importlib.util
+
 import httpx
+import orjson
 from httpx import HTTPStatusError, RequestError
 import redis.asyncio as redis
 
@@ -31,6 +35,9 @@ ONEC_BASE_URL = "http://172.16.77.34/stroyast_test/hs/Ai"  # Базовый URL
 ONEC_USERNAME = os.getenv("C1_API_USER", "Admin")
 ONEC_PASSWORD = os.getenv("C1_API_PASSWORD", "789654")
 ONEC_TIMEOUT = int(os.getenv("C1_API_TIMEOUT_SECONDS", "60"))
+# HTTP/2: параллельные батчи идут потоками одного соединения.
+# Работает только для https (ALPN) и при установленном пакете h2 (httpx[http2]).
+ONEC_HTTP2 = os.getenv("C1_API_HTTP2", "false").lower() == "true"
 
 # Конфигурация Redis
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")  # localhost для локальной разработки, переопределяется на redis:6379 в Docker
@@ -40,6 +47,33 @@ REDIS_TTL = 7200  # 2 часа
 
 # Размер батча для GetDetailedItems
 BATCH_SIZE = 50
+# Сколько батчей GetDetailedItems запрашивать одновременно
+BATCH_CONCURRENCY = int(os.getenv("C1_SYNC_CONCURRENCY", "4"))
+
+
+def _loads_1c_json(content: bytes) -> Any:
+    """Разбор JSON ответа 1C через orjson (1C может добавлять UTF-8 BOM)."""
+    return orjson.loads(content.removeprefix(codecs.BOM_UTF8))
+
+
+# Поля которые могут содержать числа с пробелами
+NUMERIC_FIELDS = (
+    'Толщина', 'Ширина', 'Длина',  # Размеры в мм
+    'Остаток',  # Остаток на складе
+    'ПлотностькгмОбщие',  # кг/м³
+    'СрокпроизводстваднОбщие',  # Срок производства в днях
+    'ПопулярностьОбщие',  # Популярность (рейтинг)
+)
+# Удаление всех пробелов (включая неразрывные \xa0) за один проход str.translate
+_NUMERIC_SPACES_TABLE = str.maketrans('', '', ' \xa0')
+
+
+def _strip_numeric_spaces(item: Dict[str, Any]) -> None:
+    """Убрать пробелы из числовых полей item (на месте)."""
+    for field in NUMERIC_FIELDS:
+        value = item.get(field)
+        if value and isinstance(value, str):
+            item[field] = value.translate(_NUMERIC_SPACES_TABLE)
 
 
 class CatalogSyncService:
@@ -47,6 +81,7 @@ class CatalogSyncService:
 
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
+        self.http_client: Optional[httpx.AsyncClient] = None
         self.is_syncing = False
         self.last_sync_time: Optional[datetime] = None
         self.last_sync_success = False
@@ -69,6 +104,35 @@ class CatalogSyncService:
             self.redis_client = None
             logger.info("Redis client closed")
 
+    def get_http_client(self) -> httpx.AsyncClient:
+        """
+        Общий HTTP клиент к 1C (keep-alive + пул соединений).
+
+        Создается лениво и переиспользуется всеми запросами синхронизации
+        вместо нового клиента (и TCP-подключения) на каждый батч.
+        """
+        if self.http_client is None or self.http_client.is_closed:
+            http2 = ONEC_HTTP2
+            if http2 and importlib.util.find_spec("h2") is None:
+                logger.warning("C1_API_HTTP2=true, but package h2 is not installed - using HTTP/1.1")
+                http2 = False
+            self.http_client = httpx.AsyncClient(
+                base_url=ONEC_BASE_URL,
+                http2=http2,
+                auth=(ONEC_USERNAME, ONEC_PASSWORD),
+                headers={"Accept": "application/json"},
+                timeout=ONEC_TIMEOUT,
+                limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
+            )
+        return self.http_client
+
+    async def close_http_client(self):
+        """Закрытие HTTP клиента к 1C."""
+        if self.http_client:
+            await self.http_client.aclose()
+            self.http_client = None
+            logger.info("1C HTTP client closed")
+
     async def get_all_groups(self) -> Dict[str, Any]:
         """
         Получить все группы и товары из GetGroups.
@@ -78,28 +142,24 @@ class CatalogSyncService:
         """
         logger.info("📦 Fetching catalog from 1C GetGroups API...")
 
-        async with httpx.AsyncClient(timeout=ONEC_TIMEOUT) as client:
-            try:
-                response = await client.get(
-                    f"{ONEC_BASE_URL}/GetGroups",
-                    auth=(ONEC_USERNAME, ONEC_PASSWORD),
-                    headers={
-                        "Content-Type": "application/json",
-                        "Accept": "application/json"
-                    }
-                )
-                response.raise_for_status()
-                data = response.json()
-
-                groups_count = len(data.get('groups', []))
-                items_count = sum(len(g.get('items', [])) for g in data.get('groups', []))
-
-                logger.info(f"   ✅ Received {groups_count} groups, {items_count} items")
-                return data
-
-            except (HTTPStatusError, RequestError) as e:
-                logger.error(f"   ❌ Error fetching groups: {e}")
-                return {"groups": []}
+        client = self.get_http_client()
+        try:
+            response = await client.get(
+                "/GetGroups",
+                headers={"Content-Type": "application/json"}
+            )
+            response.raise_for_status()
+            data = _loads_1c_json(response.content)
+
+            groups_count = len(data.get('groups', []))
+            items_count = sum(len(g.get('items', [])) for g in data.get('groups', []))
+
+            logger.info(f"   ✅ Received {groups_count} groups, {items_count} items")
+            return data
+
+        except (HTTPStatusError, RequestError) as e:
+            logger.error(f"   ❌ Error fetching groups: {e}")
+            return {"groups": []}
 
     async def get_detailed_items_batch(
         self,
@@ -124,28 +184,24 @@ class CatalogSyncService:
         batch_info = f"[Batch {batch_num}/{total_batches}]" if total_batches > 0 else ""
         logger.info(f"   🔍 {batch_info} Fetching details for {len(item_codes)} items...")
 
-        async with httpx.AsyncClient(timeout=ONEC_TIMEOUT) as client:
-            try:
-                response = await client.post(
-                    f"{ONEC_BASE_URL}/GetDetailedItems",
-                    json={"items": item_codes},
-                    auth=(ONEC_USERNAME, ONEC_PASSWORD),
-                    headers={
-                        "Content-Type": "application/json; charset=utf-8",
-                        "Accept": "application/json"
-                    }
-                )
-                response.raise_for_status()
-
-                data = response.json()
-                items = data.get('items', [])
-
-                logger.info(f"      ✅ Received {len(items)} detailed items")
-                return items
-
-            except (HTTPStatusError, RequestError) as e:
-                logger.error(f"      ❌ Error fetching batch: {e}")
-                return []
+        client = self.get_http_client()
+        try:
+            response = await client.post(
+                "/GetDetailedItems",
+                json={"items": item_codes},
+                headers={"Content-Type": "application/json; charset=utf-8"}
+            )
+            response.raise_for_status()
+
+            data = _loads_1c_json(response.content)
+            items = data.get('items', [])
+
+            logger.info(f"      ✅ Received {len(items)} detailed items")
+            return items
+
+        except (HTTPStatusError, RequestError) as e:
+            logger.error(f"      ❌ Error fetching batch: {e}")
+            return []
 
     async def get_all_detailed_items(self, item_codes: List[str]) -> List[Dict[str, Any]]:
         """
@@ -158,21 +214,26 @@ class CatalogSyncService:
             Список всех товаров с детальной информацией
         """
         logger.info(f"\n📋 Fetching detailed info for {len(item_codes)} items...")
-        logger.info(f"   Batch size: {BATCH_SIZE}")
+        logger.info(f"   Batch size: {BATCH_SIZE}, concurrency: {BATCH_CONCURRENCY}")
 
-        all_items = []
         total_batches = (len(item_codes) + BATCH_SIZE - 1) // BATCH_SIZE
+        batches = [item_codes[i:i + BATCH_SIZE] for i in range(0, len(item_codes), BATCH_SIZE)]
 
-        for i in range(0, len(item_codes), BATCH_SIZE):
-            batch = item_codes[i:i + BATCH_SIZE]
-            batch_num = (i // BATCH_SIZE) + 1
+        # Батчи идут параллельно через общий клиент; семафор ограничивает
+        # число одновременных запросов, чтобы не перегружать 1C
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
 
-            items = await self.get_detailed_items_batch(batch, batch_num, total_batches)
-            all_items.extend(items)
+        async def fetch_batch(batch: List[str], batch_num: int) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self.get_detailed_items_batch(batch, batch_num, total_batches)
 
-            # Небольшая задержка между запросами
-            if i + BATCH_SIZE < len(item_codes):
-                await asyncio.sleep(0.5)
+        results = await asyncio.gather(
+            *(fetch_batch(batch, num) for num, batch in enumerate(batches, 1))
+        )
+
+        all_items = []
+        for items in results:
+            all_items.extend(items)
 
         logger.info(f"\n   ✅ Total detailed items received: {len(all_items)}/{len(item_codes)}")
         return all_items
@@ -212,24 +273,8 @@ class CatalogSyncService:
         1C API возвращает числа с неразрывными пробелами (\xa0): "1 250", "2 500"
         Очищаем их для корректной работы парсинга.
         """
-        # Поля которые могут содержать числа с пробелами
-        numeric_fields = [
-            'Толщина', 'Ширина', 'Длина',  # Размеры в мм
-            'Остаток',  # Остаток на складе
-            'ПлотностькгмОбщие',  # кг/м³
-            'СрокпроизводстваднОбщие',  # Срок производства в днях
-            'ПопулярностьОбщие',  # Популярность (рейтинг)
-        ]
-
         cleaned = item.copy()
-
-        for field in numeric_fields:
-            if field in cleaned and cleaned[field]:
-                value = cleaned[field]
-                if isinstance(value, str):
-                    # Удаляем все пробелы (включая неразрывные \xa0)
-                    cleaned[field] = value.replace(' ', '').replace('\xa0', '')
-
+        _strip_numeric_spaces(cleaned)
         return cleaned
 
     def merge_data(
@@ -280,8 +325,8 @@ class CatalogSyncService:
                     **flat,  # group_name, group_code, item_code, item_name
                     **detailed  # все поля из API
                 }
-                # Очищаем числовые поля от неразрывных пробелов
-                merged_item = self.clean_numeric_fields(merged_item)
+                # Очищаем числовые поля от неразрывных пробелов (merged_item - уже новый dict, копия не нужна)
+                _strip_numeric_spaces(merged_item)
                 merged.append(merged_item)
             else:
                 # Если деталей нет - добавляем базовую информацию
@@ -309,8 +354,10 @@ class CatalogSyncService:
         try:
             await self.init_redis()
 
-            # Сохраняем каталог в JSON
-            catalog_json = json.dumps(data, ensure_ascii=False)
+            # Сохраняем каталог в JSON (orjson: сразу UTF-8 bytes, в разы быстрее json.dumps).
+            # Сериализация каталога в несколько МБ - в отдельном потоке: event loop API
+            # в это время продолжает обслуживать /chat
+            catalog_json = await asyncio.to_thread(orjson.dumps, data)
             await self.redis_client.set(
                 REDIS_CATALOG_KEY,
                 catalog_json,
@@ -378,15 +425,16 @@ class CatalogSyncService:
             # 2. Преобразуем в flat список
             flat_items = self.flatten_catalog(catalog)
 
-            # 3. Получаем все коды товаров
-            all_codes = list(set(item['item_code'] for item in flat_items if item['item_code']))
+            # 3. Получаем все коды товаров (dict.fromkeys - без дублей, в порядке каталога,
+            # так состав батчей не меняется от запуска к запуску)
+            all_codes = list(dict.fromkeys(item['item_code'] for item in flat_items if item['item_code']))
             logger.info(f"\n   Unique item codes: {len(all_codes)}")
 
             # 4. Получаем детали (батчами)
             detailed_items = await self.get_all_detailed_items(all_codes)
 
-            # 5. Объединяем данные
-            merged_data = self.merge_data(flat_items, detailed_items)
+            # 5. Объединяем данные (проход по всему каталогу - вне event loop)
+            merged_data = await asyncio.to_thread(self.merge_data, flat_items, detailed_items)
 
             # 6. Сохраняем в Redis
             success = await self.save_to_redis(merged_data)
@@ -452,7 +500,8 @@ class CatalogSyncService:
                 logger.warning("⚠️  Catalog not found in Redis")
                 return None
 
-            catalog = json.loads(catalog_json)
+            # Разбор каталога в несколько МБ - в отдельном потоке, не блокируя event loop
+            catalog = await asyncio.to_thread(orjson.loads, catalog_json)
             logger.info(f"✅ Loaded {len(catalog)} items from Redis")
             return catalog
 
@@ -0,0 +1,51 @@
+"""
+Тестовый скрипт для проверки BM25 индекса базы знаний (tools/search_company_info.py).
+Не требует БД: индекс строится из разделов, заданных в тесте.
+"""
+import sys
+import os
+
+# Добавляем путь к backend для импорта
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tools.search_company_info import build_kb_index, tokenize
+
+
+def _section(title: str, content: str) -> dict:
+    return {"title": title, "keywords": [], "content": content}
+
+
+def test_frequent_term_still_ranks():
+    """Термин из 20-50% разделов ("доставка") остается в индексе и находит свои разделы."""
+    print("=" * 80)
+    print("ТЕСТ: частый термин KB участвует в ранжировании")
+    print("=" * 80)
+
+    sections = {
+        f"delivery_{i}": _section(f"Условия {i}", f"Доставка по зоне {i}, стоимость зависит от расстояния")
+        for i in range(4)
+    }
+    sections.update({
+        f"other_{i}": _section(f"Раздел {i}", f"Пиломатериалы, сушка и обработка, вариант {i}")
+        for i in range(8)
+    })
+    # "доставка" в 4 из 12 разделов (33%): idf положительный, термин значимый
+    kb_index = build_kb_index(sections)
+    scores = kb_index.get_scores(tokenize("доставка"))
+
+    for section_key, score in zip(kb_index.section_keys, scores):
+        print(f"  {section_key}: {score:.3f}")
+
+    best = kb_index.section_keys[int(scores.argmax())]
+    assert "доставка" in kb_index.term_ids, "термин 'доставка' выпал из индекса"
+    assert scores.max() > 0, "запрос 'доставка' не набрал score ни в одном разделе"
+    assert best.startswith("delivery_"), f"лучший раздел {best} не про доставку"
+    assert all(
+        score == 0 for key, score in zip(kb_index.section_keys, scores) if key.startswith("other_")
+    )
+    print("✅ Разделы про доставку найдены")
+    print()
+
+
+if __name__ == "__main__":
+    test_frequent_term_still_ranks()
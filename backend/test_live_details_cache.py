@@ -0,0 +1,53 @@
+"""
+Тестовый скрипт для проверки кеша fetch_live_product_details (tools/get_product_live_details.py).
+Не обращается к 1C: запрос в GetDetailedItems подменяется в тесте.
+"""
+import importlib
+import sys
+import os
+
+# Добавляем путь к backend для импорта
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# tools/__init__ реэкспортирует одноименный @tool - берем сам модуль
+live_details = importlib.import_module("tools.get_product_live_details")
+
+
+def test_partial_cache_hit():
+    """Известные коды берутся из кеша, в 1C идут только недостающие; порядок - как в запросе."""
+    print("=" * 80)
+    print("ТЕСТ: частичное попадание в кеш живых данных 1C")
+    print("=" * 80)
+
+    requested = []
+
+    def fake_request(item_codes):
+        requested.append(list(item_codes))
+        # 1C вернула товар без кода на месте D и товар по коду B
+        return [{"Наименование": "Без кода", "Цена": 400}, {"Код": "B", "Цена": 200}]
+
+    original_request = live_details._request_live_items
+    live_details._request_live_items = fake_request
+    live_details._cache.clear()
+    live_details._item_cache.clear()
+    try:
+        live_details._cache_put(("A", "C"), [{"Код": "A", "Цена": 100}, {"Код": "C", "Цена": 300}])
+
+        items = live_details.fetch_live_product_details(["A", "D", "B", "C"])
+    finally:
+        live_details._request_live_items = original_request
+        live_details._cache.clear()
+        live_details._item_cache.clear()
+
+    prices = [item["Цена"] for item in items]
+    print(f"  Запросы в 1C: {requested}")
+    print(f"  Цены по порядку: {prices}")
+
+    assert requested == [["D", "B"]], f"в 1C должны идти только недостающие коды, а ушло {requested}"
+    assert prices == [100, 400, 200, 300], f"порядок товаров не совпадает с запросом: {prices}"
+    print("✅ Кеш и ответ 1C объединены в порядке запроса")
+    print()
+
+
+if __name__ == "__main__":
+    test_partial_cache_hit()
@@ -9,6 +9,8 @@ from typing import Optional
 from pydantic import BaseModel, Field
 from langchain.tools import tool
 
+from utils.price_calculator import format_rub
+
 logger = logging.getLogger(__name__)
 
 
@@ -114,8 +116,8 @@ def calculate(request: CalculationRequest) -> str:
 
             result = f"""💰 Расчет стоимости:
 Количество: {qty_str}
-Цена: {request.price_per_unit:,.0f} ₽/{unit}
-Итого: {total:,.0f} ₽""".replace(",", " ")
+Цена: {format_rub(request.price_per_unit)} ₽/{unit}
+Итого: {format_rub(total)} ₽"""
             return result
 
         elif calc_type == "pieces":
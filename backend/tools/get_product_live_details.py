@@ -3,11 +3,206 @@ Tool для получения актуальной информации о то
 Используется после того, как клиент определился с конкретным товаром.
 """
 import os
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from langchain.tools import tool
-import json
+import orjson
+
+from tools.product_search_bm25 import load_catalog_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Максимум кодов в одном POST к 1C; больше - режем на пачки и шлем параллельно
+MAX_CODES_PER_CALL = 50
+_chunk_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="c1-details")
+
+# Повтор запроса к 1C на 5xx/таймаут: всего попыток, пауза и таймаут чтения повтора
+_RETRY_ATTEMPTS = 2
+_RETRY_BACKOFF_SECONDS = 0.2
+_RETRY_READ_TIMEOUT_SECONDS = 5.0
+
+# Общая HTTP-сессия к 1C: переиспользует TCP-соединения (keep-alive)
+# между вызовами вместо нового подключения на каждый запрос.
+# Пул рассчитан на параллельные вызовы tool + пачки из _chunk_executor.
+_POOL_MAXSIZE = 16
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """Ленивая инициализация общей сессии (tool вызывается из разных потоков)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.auth = HTTPBasicAuth(
+                    os.getenv("C1_API_USER", "Admin"),
+                    os.getenv("C1_API_PASSWORD", "789654"),
+                )
+                session.headers.update({
+                    'Content-Type': 'application/json; charset=utf-8',
+                    'Accept': 'application/json',
+                    'Connection': 'keep-alive',
+                })
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_POOL_MAXSIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+# Короткий TTL-кеш ответов 1C. Соседние реплики диалога часто спрашивают
+# те же товары; цена/остаток за несколько десятков секунд не меняются.
+# _cache: кортеж кодов в порядке запроса -> ответ целиком;
+# _item_cache: код -> товар (из ответов, где 1C вернула "Код"), чтобы
+# пересекающиеся наборы кодов тоже обслуживались без запроса в 1C.
+_CACHE_TTL_SECONDS = float(os.getenv("C1_DETAILS_CACHE_TTL_SECONDS", "30"))
+_CACHE_MAX_SIZE = 512
+_ITEM_CACHE_MAX_SIZE = 4096
+_cache: Dict[Tuple[str, ...], Tuple[float, List[Dict[str, Any]]]] = {}
+_item_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_cache_lock = threading.Lock()
+
+
+def _evict(cache: Dict[Any, Tuple[float, Any]], max_size: int, now: float) -> None:
+    """Освободить место в кеше: сначала просроченные, затем самые старые записи."""
+    if len(cache) < max_size:
+        return
+    for stale_key in [k for k, (expires_at, _) in cache.items() if expires_at < now]:
+        del cache[stale_key]
+    while len(cache) >= max_size:
+        # dict сохраняет порядок вставки - удаляем самые старые записи
+        del cache[next(iter(cache))]
+
+
+def _cache_get(key: Tuple[str, ...]) -> Optional[List[Dict[str, Any]]]:
+    now = time.monotonic()
+    # Под блокировкой: _cache_put из другого потока может в это время чистить кеш
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            expires_at, items = entry
+            if expires_at >= now:
+                return list(items)
+            _cache.pop(key, None)
+    return None
+
+
+def _cached_items_by_code(codes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Непросроченные товары из кеша по кодам (код -> товар), только найденные."""
+    now = time.monotonic()
+    found = {}
+    with _cache_lock:
+        for code in codes:
+            item_entry = _item_cache.get(code)
+            if item_entry is not None and item_entry[0] >= now:
+                found[code] = item_entry[1]
+    return found
+
+
+def _cache_put(key: Tuple[str, ...], items: List[Dict[str, Any]]) -> None:
+    now = time.monotonic()
+    expires_at = now + _CACHE_TTL_SECONDS
+    with _cache_lock:
+        _evict(_cache, _CACHE_MAX_SIZE, now)
+        _cache[key] = (expires_at, items)
+        for item in items:
+            code = item.get("Код")
+            if code:
+                _evict(_item_cache, _ITEM_CACHE_MAX_SIZE, now)
+                _item_cache[code] = (expires_at, item)
+
+
+# Запросы в полёте: ключ кеша -> Future с результатом первого запроса
+_inflight: Dict[Tuple[str, ...], Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def _request_live_items(item_codes: List[str]) -> List[Dict[str, Any]]:
+    """POST в 1C GetDetailedItems, без кеша (с одним повтором на 5xx/таймаут)."""
+    base_url = os.getenv("C1_DETAILED_API_URL", "http://172.16.77.34/stroyast_test/hs/Ai/GetDetailedItems")
+    # (connect, read): недоступный 1C отваливается быстро, медленный ответ ждем дольше
+    timeout = (
+        float(os.getenv("C1_API_CONNECT_TIMEOUT_SECONDS", "3")),
+        float(os.getenv("C1_API_TIMEOUT_SECONDS", "30")),
+    )
+
+    payload = {"items": item_codes}
+
+    # Одна быстрая повторная попытка на 5xx/таймаут, прежде чем сдаться
+    for attempt in range(_RETRY_ATTEMPTS):
+        is_last = attempt == _RETRY_ATTEMPTS - 1
+        try:
+            response = _get_session().post(
+                base_url,
+                json=payload,
+                timeout=timeout
+            )
+            response.raise_for_status()
+            break
+        except requests.Timeout:
+            if is_last:
+                raise
+            # Повтор - с коротким таймаутом чтения, чтобы не удваивать ожидание
+            timeout = (timeout[0], min(timeout[1], _RETRY_READ_TIMEOUT_SECONDS))
+        except requests.HTTPError as e:
+            if is_last or e.response is None or e.response.status_code < 500:
+                raise
+        logger.info(f"1C details: retrying after failed attempt {attempt + 1}")
+        time.sleep(_RETRY_BACKOFF_SECONDS * (attempt + 1))
+
+    try:
+        data = orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        # Ответ не в UTF-8 - определяем кодировку, как раньше
+        response.encoding = response.apparent_encoding or 'utf-8'
+        data = orjson.loads(response.text)
+    return data.get('items', [])
+
+
+def _merge_cached_and_fetched(
+    item_codes: List[str],
+    known: Dict[str, Dict[str, Any]],
+    missing: List[str],
+    fetched: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """
+    Товары в порядке item_codes: из кеша (known) или из ответа 1C на коды missing.
+
+    Товар 1C без "Код" (или с незапрошенным кодом) встает на место очередного
+    кода, для которого ответа по коду нет, - ответ по-прежнему позиционный, и
+    get_product_live_details подставит код запроса. Лишние товары - в конце.
+    """
+    missing_codes = set(missing)
+    by_code: Dict[str, Dict[str, Any]] = {}
+    unmatched: List[Dict[str, Any]] = []
+    for item in fetched:
+        code = item.get("Код")
+        if code in missing_codes and code not in by_code:
+            by_code[code] = item
+        else:
+            unmatched.append(item)
+
+    items: List[Dict[str, Any]] = []
+    unmatched_iter = iter(unmatched)
+    for code in item_codes:
+        if code in known:
+            items.append(known[code])
+        elif code in by_code:
+            items.append(by_code[code])
+        else:
+            item = next(unmatched_iter, None)
+            if item is not None:
+                items.append(item)
+    items.extend(unmatched_iter)
+    return items
 
 
 def fetch_live_product_details(item_codes: List[str]) -> List[Dict[str, Any]]:
@@ -18,33 +213,144 @@ def fetch_live_product_details(item_codes: List[str]) -> List[Dict[str, Any]]:
         item_codes: Список кодов товаров (из каталога или из предыдущего поиска)
 
     Returns:
-        Список товаров с актуальной информацией (цена, остаток, характеристики)
+        Список товаров с актуальной информацией (цена, остаток, характеристики).
+        Ответ кешируется на C1_DETAILS_CACHE_TTL_SECONDS секунд (по умолчанию 30);
+        словари товаров общие для попаданий в кеш - не изменяйте их.
     """
-    base_url = os.getenv("C1_DETAILED_API_URL", "http://172.16.77.34/stroyast_test/hs/Ai/GetDetailedItems")
-    username = os.getenv("C1_API_USER", "Admin")
-    password = os.getenv("C1_API_PASSWORD", "789654")
-    timeout = int(os.getenv("C1_API_TIMEOUT_SECONDS", "30"))
-
-    auth = HTTPBasicAuth(username, password)
-    headers = {
-        'Content-Type': 'application/json; charset=utf-8',
-        'Accept': 'application/json'
-    }
-
-    payload = {"items": item_codes}
-
-    response = requests.post(
-        base_url,
-        json=payload,
-        auth=auth,
-        headers=headers,
-        timeout=timeout
-    )
-    response.encoding = response.apparent_encoding or 'utf-8'
-    response.raise_for_status()
-
-    data = response.json()
-    return data.get('items', [])
+    if len(item_codes) > MAX_CODES_PER_CALL:
+        chunks = [
+            item_codes[i:i + MAX_CODES_PER_CALL]
+            for i in range(0, len(item_codes), MAX_CODES_PER_CALL)
+        ]
+        logger.info(
+            f"1C details: {len(item_codes)} codes split into {len(chunks)} parallel requests"
+        )
+        items: List[Dict[str, Any]] = []
+        for chunk_items in _chunk_executor.map(fetch_live_product_details, chunks):
+            items.extend(chunk_items)
+        return items
+
+    cache_key = tuple(item_codes)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Набор целиком не запрашивался - товары, уже известные по коду, берем из кеша,
+    # а в 1C одним запросом идут только недостающие коды
+    known = _cached_items_by_code(item_codes)
+    if known:
+        missing = [code for code in item_codes if code not in known]
+        fetched = fetch_live_product_details(missing) if missing else []
+        return _merge_cached_and_fetched(item_codes, known, missing, fetched)
+
+    # Single-flight: одинаковые параллельные запросы ждут один POST в 1C
+    with _inflight_lock:
+        future = _inflight.get(cache_key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight[cache_key] = future
+
+    if not is_owner:
+        return list(future.result())
+
+    try:
+        items = _request_live_items(item_codes)
+        _cache_put(cache_key, items)
+        future.set_result(items)
+        return list(items)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(cache_key, None)
+
+
+# (поле 1C, шаблон строки) - в порядке вывода в ответе
+_LIVE_PARAM_TEMPLATES = (
+    ("Влажность", "      Влажность: {}"),
+    ("Типобработки", "      Обработка: {}"),
+    ("Плотностькгм3Общие", "      Плотность: {} кг/м³"),
+    ("Допсвойство", "      Доп. свойство: {}"),
+)
+_LIVE_EXTRA_TEMPLATES = (
+    ("СрокпроизводстваднОбщие", "   ⏱️ Срок производства: {} дней"),
+    ("Количествовм2Общие", "   📐 В 1 шт: {} м²"),
+    ("Количествовм3Общие", "   📦 В 1 шт: {} м³"),
+    ("КоличествовупаковкеОбщие", "   📦 В упаковке: {} шт"),
+    ("Дополнительнаяедизмерения1", "   Ед.изм.1: {}"),
+    ("Дополнительнаяедизмерения2", "   Ед.изм.2: {}"),
+    ("Дополнительнаяедизмерения3Общие", "   Ед.изм.3: {}"),
+)
+
+
+def _append_item_lines(lines: List[str], i: int, item: Dict[str, Any], fallback_code: str) -> None:
+    """Дописать в lines блок одного товара (без промежуточных списков на каждый товар)."""
+    get = item.get
+    append = lines.append
+    name = get("Наименованиедлясайта") or get("Наименование") or get("item_name", "N/A")
+
+    lines += [
+        f"### {i}. {name}",
+        f"   Код: {get('Код', fallback_code)}",
+        f"   💰 Цена: {get('Цена', 'N/A')} руб.",
+        f"   📦 Остаток: {get('Остаток', 'N/A')}",
+        "   ",
+        "   📋 Характеристики:",
+    ]
+
+    # Характеристики
+    material_type = get("Видпиломатериала")
+    if material_type:
+        append(f"      Вид: {material_type}")
+    wood = get("Порода")
+    if wood:
+        append(f"      Порода: {wood}")
+
+    # Сорт или Класс
+    grade = get("Сорт")
+    klass = get("Класс")
+    if grade and klass:
+        append(f"      Сорт/Класс: {grade} ({klass})")
+    elif grade:
+        append(f"      Сорт: {grade}")
+    elif klass:
+        append(f"      Класс: {klass}")
+
+    # Размеры
+    thickness = get("Толщина")
+    width = get("Ширина")
+    length = get("Длина")
+    if thickness and width and length:
+        append(f"      Размеры: {thickness}х{width}х{length} мм")
+    elif thickness or width or length:
+        dims = [
+            f"{label} {value}"
+            for label, value in (("толщина", thickness), ("ширина", width), ("длина", length))
+            if value
+        ]
+        append(f"      Размеры: {', '.join(dims)}")
+
+    for key, template in _LIVE_PARAM_TEMPLATES:
+        value = get(key)
+        if value:
+            append(template.format(value))
+    popularity = get("ПопулярностьОбщие")
+    if popularity and float(popularity) > 0:
+        append(f"      ⭐ Популярность: {popularity}")
+
+    # Дополнительная информация
+    additional_info = [
+        template.format(value)
+        for key, template in _LIVE_EXTRA_TEMPLATES
+        if (value := get(key))
+    ]
+    if additional_info:
+        append("   ")
+        lines += additional_info
+
+    append("")
 
 
 @tool
@@ -69,115 +375,33 @@ def get_product_live_details(item_codes: str) -> str:
     if not item_codes or not item_codes.strip():
         return "Ошибка: необходимо указать код товара. Сначала найдите товар через search_products_tool."
 
-    # Parse codes (поддержка нескольких кодов через запятую)
-    codes = [code.strip() for code in item_codes.split(",") if code.strip()]
+    # Parse codes (поддержка нескольких кодов через запятую), повторы убираем с сохранением порядка
+    codes = list(dict.fromkeys(code for raw in item_codes.split(",") if (code := raw.strip())))
 
     if not codes:
         return "Ошибка: неверный формат кода товара."
 
-    items = fetch_live_product_details(codes)
+    try:
+        items = fetch_live_product_details(codes)
+        response_lines = []
+    except Exception as e:
+        # 1C недоступна - отвечаем данными из последней синхронизации каталога
+        logger.warning(f"1C details unavailable, falling back to catalog snapshot: {repr(e)}")
+        items = load_catalog_snapshot().find_by_codes(codes)
+        response_lines = [
+            "⚠️ 1С временно недоступна: данные из каталога на момент последней синхронизации, "
+            "цену и остаток нужно уточнить у менеджера.",
+            "",
+        ]
 
     if not items:
         return f"Товары с кодами {item_codes} не найдены или временно недоступны."
 
     # Format response
-    response_lines = [f"Актуальная информация о {len(items)} товаре(ах):", ""]
+    response_lines += [f"Актуальная информация о {len(items)} товаре(ах):", ""]
 
     for i, item in enumerate(items, 1):
-        name = item.get("Наименованиедлясайта") or item.get("Наименование") or item.get("item_name", "N/A")
-        price = item.get("Цена", "N/A")
-        stock = item.get("Остаток", "N/A")
-        code = item.get("Код", codes[i-1] if i <= len(codes) else "N/A")
-
-        response_lines.append(f"### {i}. {name}")
-        response_lines.append(f"   Код: {code}")
-        response_lines.append(f"   💰 Цена: {price} руб.")
-        response_lines.append(f"   📦 Остаток: {stock}")
-
-        # Характеристики
-        material_type = item.get("Видпиломатериала")
-        wood = item.get("Порода")
-        grade = item.get("Сорт")
-        klass = item.get("Класс")
-        thickness = item.get("Толщина")
-        width = item.get("Ширина")
-        length = item.get("Длина")
-        moisture = item.get("Влажность")
-        treatment = item.get("Типобработки")
-        density = item.get("Плотностькгм3Общие")
-        extra_property = item.get("Допсвойство")
-        popularity = item.get("ПопулярностьОбщие")
-
-        response_lines.append("   ")
-        response_lines.append("   📋 Характеристики:")
-
-        if material_type:
-            response_lines.append(f"      Вид: {material_type}")
-        if wood:
-            response_lines.append(f"      Порода: {wood}")
-
-        # Сорт или Класс
-        if grade and klass:
-            response_lines.append(f"      Сорт/Класс: {grade} ({klass})")
-        elif grade:
-            response_lines.append(f"      Сорт: {grade}")
-        elif klass:
-            response_lines.append(f"      Класс: {klass}")
-
-        # Размеры
-        if thickness and width and length:
-            response_lines.append(f"      Размеры: {thickness}х{width}х{length} мм")
-        elif any([thickness, width, length]):
-            dims = []
-            if thickness:
-                dims.append(f"толщина {thickness}")
-            if width:
-                dims.append(f"ширина {width}")
-            if length:
-                dims.append(f"длина {length}")
-            response_lines.append(f"      Размеры: {', '.join(dims)}")
-
-        if moisture:
-            response_lines.append(f"      Влажность: {moisture}")
-        if treatment:
-            response_lines.append(f"      Обработка: {treatment}")
-        if density:
-            response_lines.append(f"      Плотность: {density} кг/м³")
-        if extra_property:
-            response_lines.append(f"      Доп. свойство: {extra_property}")
-        if popularity and float(popularity) > 0:
-            response_lines.append(f"      ⭐ Популярность: {popularity}")
-
-        # Дополнительная информация
-        production_days = item.get("СрокпроизводстваднОбщие")
-        qty_m2 = item.get("Количествовм2Общие")
-        qty_m3 = item.get("Количествовм3Общие")
-        qty_pack = item.get("КоличествовупаковкеОбщие")
-        extra_unit1 = item.get("Дополнительнаяедизмерения1")
-        extra_unit2 = item.get("Дополнительнаяедизмерения2")
-        extra_unit3 = item.get("Дополнительнаяедизмерения3Общие")
-
-        additional_info = []
-        if production_days:
-            additional_info.append(f"⏱️ Срок производства: {production_days} дней")
-        if qty_m2:
-            additional_info.append(f"📐 В 1 шт: {qty_m2} м²")
-        if qty_m3:
-            additional_info.append(f"📦 В 1 шт: {qty_m3} м³")
-        if qty_pack:
-            additional_info.append(f"📦 В упаковке: {qty_pack} шт")
-        if extra_unit1:
-            additional_info.append(f"Ед.изм.1: {extra_unit1}")
-        if extra_unit2:
-            additional_info.append(f"Ед.изм.2: {extra_unit2}")
-        if extra_unit3:
-            additional_info.append(f"Ед.изм.3: {extra_unit3}")
-
-        if additional_info:
-            response_lines.append("   ")
-            for info in additional_info:
-                response_lines.append(f"   {info}")
-
-        response_lines.append("")
+        fallback_code = codes[i-1] if i <= len(codes) else "N/A"
+        _append_item_lines(response_lines, i, item, fallback_code)
 
     return "\n".join(response_lines)
@@ -4,18 +4,414 @@ Dynamic product search with BM25 ranking and LangChain tool integration.
 Catalog is loaded from Redis (synced from 1C API).
 """
 
-from typing import Optional, List, Dict, Any
-from dataclasses import dataclass, asdict
+from typing import Optional, List, Dict, Any, Tuple
+from dataclasses import dataclass, asdict, astuple, field
+from collections import Counter
+from functools import lru_cache
 import os
-import json
+import re
+import sys
+import threading
+import time
+import orjson
 import logging
+import numpy as np
 import pandas as pd
-from rank_bm25 import BM25Okapi
 from langchain.tools import tool
 import redis
 
 logger = logging.getLogger(__name__)
 
+REDIS_CATALOG_KEY = "catalog:products"
+REDIS_CATALOG_METADATA_KEY = "catalog:metadata"
+
+# Категориальные фильтры: поле ProductSearchParams -> колонка каталога
+CATEGORICAL_FILTERS = {
+    'material_type': 'Видпиломатериала',
+    'wood_species': 'Порода',
+    'grade': 'Сорт',
+    'moisture': 'Влажность',
+    'treatment': 'Типобработки',
+    'group_name': 'group_name',
+}
+
+# Колонки, из которых собирается текст для BM25
+SEARCH_TEXT_COLUMNS = ['item_name', 'Наименование', 'Наименованиедлясайта']
+
+# Колонки каталога, которые реально используются поиском, ответом
+# search_products_tool и запасным ответом get_product_live_details.
+# Остальные поля 1C в снимок не попадают - меньше памяти и быстрее копии строк.
+CATALOG_COLUMNS = [
+    'group_name', 'group_code', 'item_code', 'item_name',
+    'Код', 'Наименование', 'Наименованиедлясайта',
+    'Видпиломатериала', 'Порода', 'Сорт', 'Класс', 'Влажность', 'Типобработки', 'Допсвойство',
+    'Толщина', 'Ширина', 'Длина',
+    'Цена', 'Остаток',
+    'Плотностькгм3Общие', 'Количествовм2Общие', 'Количествовм3Общие', 'КоличествовупаковкеОбщие',
+    'СрокпроизводстваднОбщие', 'ПопулярностьОбщие',
+    'Дополнительнаяедизмерения1', 'Дополнительнаяедизмерения2', 'Дополнительнаяедизмерения3Общие',
+]
+
+# Сколько последних результатов search_products держать на один снимок каталога
+SEARCH_CACHE_SIZE = 256
+
+# Колонки с кодами товара в порядке приоритета при поиске по коду
+CODE_COLUMNS = ['Код', 'item_code', 'group_code']
+
+# Параметры BM25 - те же, что у rank_bm25.BM25Okapi по умолчанию
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
+# Тип позиций и частот в postings: каталог - тысячи строк, int32 вдвое компактнее intp
+POSTINGS_DTYPE = np.int32
+
+
+@dataclass
+class ProductTermIndex:
+    """
+    Инвертированный индекс каталога в CSR-виде (строится один раз на снимок).
+
+    Postings термина term_ids[t] лежат в doc_ids/tf[indptr[t]:indptr[t + 1]] - позиции
+    строк df и частоты термина в них. BM25 считается по строкам выборки (после
+    категориальных фильтров) только через postings терминов запроса, без
+    построения BM25Okapi по всей выборке на каждый запрос.
+
+    Для всего каталога (запрос без категориальных фильтров) BM25-вклады postings
+    посчитаны заранее в contributions: score - одна сумма вкладов через bincount.
+    """
+
+    term_ids: Dict[str, int]
+    indptr: np.ndarray
+    doc_ids: np.ndarray
+    tf: np.ndarray
+    # Номер термина для каждой записи postings (для df терминов по выборке)
+    entry_terms: np.ndarray
+    # Число токенов в каждой строке df
+    doc_len: np.ndarray
+    # Готовые BM25-вклады postings с idf и avgdl всего каталога
+    contributions: np.ndarray
+
+    def __post_init__(self):
+        # Индекс общий для всех потоков поиска - массивы только для чтения
+        for array in (self.indptr, self.doc_ids, self.tf, self.entry_terms, self.doc_len, self.contributions):
+            array.setflags(write=False)
+
+    def _catalog_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """BM25 score всех строк каталога: один векторный проход по postings терминов запроса."""
+        ids = np.array(
+            [self.term_ids[token] for token in query_tokens if token in self.term_ids],
+            dtype=np.intp,
+        )
+        if not len(ids):
+            return np.zeros(len(self.doc_len))
+
+        # Позиции всех postings запроса одним массивом (склейка диапазонов indptr без цикла);
+        # повторы токенов в запросе учитываются, как в BM25Okapi.get_scores
+        starts = self.indptr[ids]
+        lengths = self.indptr[ids + 1] - starts
+        offsets = np.cumsum(lengths) - lengths
+        entries = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        return np.bincount(
+            self.doc_ids[entries],
+            weights=self.contributions[entries],
+            minlength=len(self.doc_len),
+        )
+
+    def get_scores(self, positions: np.ndarray, query_tokens: List[str]) -> np.ndarray:
+        """
+        BM25 score строк positions (формула и idf BM25Okapi по корпусу из этих строк).
+
+        Returns:
+            Массив score в порядке positions
+        """
+        n_docs = len(positions)
+        if not n_docs:
+            return np.zeros(0)
+        if not any(token in self.term_ids for token in query_tokens):
+            # Ни одного термина запроса нет в каталоге - ни одна строка не набирает score,
+            # маска выборки и длины документов не нужны
+            return np.zeros(n_docs)
+        if n_docs == len(self.doc_len):
+            # Выборка - весь каталог: вклады уже посчитаны
+            return self._catalog_scores(query_tokens)[positions]
+        in_sample = np.zeros(len(self.doc_len), dtype=bool)
+        in_sample[positions] = True
+
+        total_len = self.doc_len[positions].sum()
+        if not total_len:
+            return np.zeros(n_docs)
+        avgdl = total_len / n_docs
+
+        # Postings терминов запроса, ограниченные строками выборки
+        query_postings = {}
+        for token in set(query_tokens):
+            term_id = self.term_ids.get(token)
+            if term_id is None:
+                continue
+            start, stop = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.doc_ids[start:stop]
+            keep = in_sample[docs]
+            if keep.any():
+                query_postings[token] = (docs[keep], self.tf[start:stop][keep])
+
+        scores = np.zeros(len(self.doc_len))
+        if not query_postings:
+            return scores[positions]
+
+        # idf как в rank_bm25: отрицательные значения заменяются на epsilon * средний idf
+        # по всем терминам выборки (df всех терминов нужен только в этом случае)
+        idf = {
+            token: np.log(n_docs - len(docs) + 0.5) - np.log(len(docs) + 0.5)
+            for token, (docs, _) in query_postings.items()
+        }
+        if min(idf.values()) < 0:
+            sample_df = np.bincount(self.entry_terms[in_sample[self.doc_ids]], minlength=len(self.term_ids))
+            sample_df = sample_df[sample_df > 0]
+            average_idf = (np.log(n_docs - sample_df + 0.5) - np.log(sample_df + 0.5)).mean()
+            idf = {token: BM25_EPSILON * average_idf if value < 0 else value for token, value in idf.items()}
+
+        # Повторы токенов в запросе учитываются, как в BM25Okapi.get_scores
+        for token in query_tokens:
+            if token not in query_postings:
+                continue
+            docs, tf = query_postings[token]
+            scores[docs] += idf[token] * (
+                tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[docs] / avgdl))
+            )
+        return scores[positions]
+
+
+@dataclass
+class CatalogSnapshot:
+    """Распарсенный каталог и производные от него структуры (строятся один раз на синхронизацию)."""
+
+    df: pd.DataFrame
+    # Допустимые значения категориальных колонок: колонка -> frozenset значений
+    categories: Dict[str, frozenset] = field(default_factory=dict)
+    # Инвертированный индекс токенов BM25 по позициям строк df
+    term_index: Optional[ProductTermIndex] = None
+    # Код товара -> позиция строки в df
+    by_code: Dict[str, int] = field(default_factory=dict)
+    # Числовые цены, отсортированные по возрастанию (индекс - метки строк df, без NaN)
+    sorted_prices: pd.Series = field(default_factory=lambda: pd.Series(dtype=float))
+    # Размеры в мм по позициям строк df: колонка -> массив (NaN - нечисловое значение)
+    dimensions: Dict[str, np.ndarray] = field(default_factory=dict)
+    # Товар в наличии (has_stock) по позициям строк df
+    in_stock: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=bool))
+
+    def __post_init__(self):
+        # Кеш результатов поиска живет вместе со снимком: новая синхронизация
+        # создает новый снимок, и старые результаты уходят вместе со старым.
+        self.search = lru_cache(maxsize=SEARCH_CACHE_SIZE)(self._search)
+
+    def _search(self, params_key: tuple) -> Tuple[Dict[str, Any], ...]:
+        return tuple(_search_snapshot(self, ProductSearchParams(*params_key)))
+
+    def labels_in_price_range(self, price_min: Optional[float], price_max: Optional[float]) -> pd.Index:
+        """Метки строк df с ценой в [price_min, price_max] - бинарным поиском по sorted_prices."""
+        start = 0 if price_min is None else self.sorted_prices.searchsorted(price_min, side='left')
+        stop = len(self.sorted_prices) if price_max is None else self.sorted_prices.searchsorted(price_max, side='right')
+        return self.sorted_prices.index[start:stop]
+
+    def find_by_codes(self, codes: List[str]) -> List[Dict[str, Any]]:
+        """Товары каталога по кодам (в порядке запроса, без пустых полей)."""
+        items = []
+        for code in codes:
+            position = self.by_code.get(code)
+            if position is None:
+                continue
+            row = self.df.iloc[position]
+            items.append({key: value for key, value in row.items() if pd.notna(value)})
+        return items
+
+
+def _build_code_index(df: pd.DataFrame) -> Dict[str, int]:
+    by_code: Dict[str, int] = {}
+    for column in CODE_COLUMNS:
+        if column not in df.columns:
+            continue
+        for position, code in enumerate(df[column]):
+            if isinstance(code, str) and code:
+                by_code.setdefault(code, position)
+    return by_code
+
+
+# Колонки размеров, по которым фильтрует search_products (в мм)
+DIMENSION_COLUMNS = ('Толщина', 'Ширина', 'Длина')
+
+
+def _dimension_or_nan(value: Any) -> float:
+    try:
+        return normalize_dimension(value)
+    except (TypeError, ValueError):
+        # Нечисловое значение не проходит ни один фильтр размеров
+        return float('nan')
+
+
+def _build_dimensions(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    return {
+        column: np.fromiter(map(_dimension_or_nan, df[column]), dtype=float, count=len(df))
+        if column in df.columns else np.zeros(len(df))
+        for column in DIMENSION_COLUMNS
+    }
+
+
+def _stock_or_false(value: Any) -> bool:
+    try:
+        return has_stock(value)
+    except (TypeError, ValueError):
+        return False
+
+
+def _build_in_stock(df: pd.DataFrame) -> np.ndarray:
+    if 'Остаток' not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return np.fromiter(map(_stock_or_false, df['Остаток']), dtype=bool, count=len(df))
+
+
+def _build_search_texts(df: pd.DataFrame) -> List[str]:
+    text_columns = [col for col in SEARCH_TEXT_COLUMNS if col in df.columns]
+    if not text_columns:
+        return [''] * len(df)
+    return [
+        ' '.join(str(value) for value in values if pd.notna(value))
+        for values in zip(*(df[col] for col in text_columns))
+    ]
+
+
+def _build_term_index(df: pd.DataFrame) -> ProductTermIndex:
+    raw_postings: Dict[str, Tuple[List[int], List[int]]] = {}
+    doc_len = np.zeros(len(df))
+    for position, text in enumerate(_build_search_texts(df)):
+        tokens = _tokenize_item_text(text)
+        doc_len[position] = len(tokens)
+        for token, count in Counter(tokens).items():
+            docs, tfs = raw_postings.setdefault(token, ([], []))
+            docs.append(position)
+            tfs.append(count)
+
+    # Postings всех терминов подряд, indptr - границы термина (как в scipy CSR)
+    df_counts = np.fromiter((len(docs) for docs, _ in raw_postings.values()), dtype=np.intp, count=len(raw_postings))
+    indptr = np.zeros(len(df_counts) + 1, dtype=POSTINGS_DTYPE)
+    np.cumsum(df_counts, out=indptr[1:])
+    doc_ids = np.fromiter(
+        (position for docs, _ in raw_postings.values() for position in docs), dtype=POSTINGS_DTYPE, count=indptr[-1]
+    )
+    tf = np.fromiter(
+        (count for _, tfs in raw_postings.values() for count in tfs), dtype=POSTINGS_DTYPE, count=indptr[-1]
+    )
+
+    # BM25-вклады для всего каталога - те же формулы, что в ProductTermIndex.get_scores
+    n_docs = len(df)
+    total_len = doc_len.sum()
+    if total_len:
+        avgdl = total_len / n_docs
+        idf = np.log(n_docs - df_counts + 0.5) - np.log(df_counts + 0.5)
+        if len(idf) and idf.min() < 0:
+            idf[idf < 0] = BM25_EPSILON * idf.mean()
+        contributions = np.repeat(idf, df_counts) * (
+            tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_len[doc_ids] / avgdl))
+        )
+    else:
+        contributions = np.zeros(len(tf))
+
+    return ProductTermIndex(
+        term_ids={token: term_id for term_id, token in enumerate(raw_postings)},
+        indptr=indptr,
+        doc_ids=doc_ids,
+        tf=tf,
+        entry_terms=np.repeat(np.arange(len(df_counts), dtype=POSTINGS_DTYPE), df_counts),
+        doc_len=doc_len,
+        contributions=contributions,
+    )
+
+
+def _build_sorted_prices(df: pd.DataFrame) -> pd.Series:
+    if 'Цена' not in df.columns:
+        return pd.Series(dtype=float)
+    return pd.to_numeric(df['Цена'], errors='coerce').dropna().sort_values(kind='stable')
+
+
+def _build_snapshot(df: pd.DataFrame) -> CatalogSnapshot:
+    categories = {
+        column: frozenset(df[column].dropna().unique()) if column in df.columns else frozenset()
+        for column in CATEGORICAL_FILTERS.values()
+    }
+    return CatalogSnapshot(
+        df=df,
+        categories=categories,
+        term_index=_build_term_index(df),
+        by_code=_build_code_index(df),
+        sorted_prices=_build_sorted_prices(df),
+        dimensions=_build_dimensions(df),
+        in_stock=_build_in_stock(df),
+    )
+
+
+# Общий Redis клиент модуля (с пулом соединений) - создается при первом обращении
+_redis_client: Optional[redis.Redis] = None
+
+
+def _get_redis() -> redis.Redis:
+    global _redis_client
+    if _redis_client is None:
+        redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")  # localhost для локальной разработки, переопределяется на redis:6379 в Docker
+        # Без decode_responses: orjson разбирает байты напрямую, без промежуточной str
+        _redis_client = redis.from_url(redis_url)
+    return _redis_client
+
+
+def _read_catalog_snapshot() -> CatalogSnapshot:
+    """Прочитать и разобрать каталог из Redis (без кеша)."""
+    catalog_json = _get_redis().get(REDIS_CATALOG_KEY)
+    if not catalog_json:
+        raise LookupError("Catalog not found in Redis")
+
+    # Парсим JSON в список объектов
+    catalog_data = orjson.loads(catalog_json)
+
+    # Создаем DataFrame только из используемых колонок
+    df = pd.DataFrame(catalog_data, columns=CATALOG_COLUMNS)
+    logger.info(f"✅ Loaded {len(df)} items from Redis")
+    return _build_snapshot(df)
+
+
+# Версия каталога проверяется в Redis не чаще раза в столько секунд: поиск не делает
+# GET метаданных на каждый вызов, новая синхронизация видна с задержкой до интервала
+CATALOG_VERSION_CHECK_SECONDS = 5.0
+# (версия, когда проверена по time.monotonic)
+_catalog_version: Tuple[Optional[str], float] = (None, 0.0)
+# Tool вызывается из потоков агента: снимок новой версии строит только один из них,
+# остальные ждут его, а не разбирают каталог параллельно
+_snapshot_lock = threading.Lock()
+
+
+def _get_catalog_version(recheck: bool = False) -> Optional[str]:
+    """Версия каталога (last_sync из catalog:metadata) с локальным кешем на CATALOG_VERSION_CHECK_SECONDS."""
+    global _catalog_version
+    version, checked_at = _catalog_version
+    now = time.monotonic()
+    if version and not recheck and now - checked_at < CATALOG_VERSION_CHECK_SECONDS:
+        return version
+
+    metadata_json = _get_redis().get(REDIS_CATALOG_METADATA_KEY)
+    version = orjson.loads(metadata_json).get("last_sync") if metadata_json else None
+    _catalog_version = (version, now)
+    return version
+
+
+@lru_cache(maxsize=1)
+def _catalog_snapshot_for_version(version: str) -> CatalogSnapshot:
+    """
+    Снимок каталога для версии (last_sync из catalog:metadata).
+
+    Каталог меняется только при синхронизации из 1C, поэтому полный JSON
+    перечитываем, только когда меняется версия; maxsize=1 - храним лишь
+    актуальный снимок.
+    """
+    return _read_catalog_snapshot()
+
 
 @dataclass
 class ProductSearchParams:
@@ -60,48 +456,55 @@ def normalize_dimension(value: Any) -> float:
     return float(normalized)
 
 
+def has_stock(value: Any) -> bool:
+    """Товар в наличии: остаток > 0 и не 'По предзаказу'."""
+    if pd.isna(value):
+        return False
+    val_str = str(value).strip()
+    if val_str == 'По предзаказу':
+        return False
+    return normalize_dimension(val_str) > 0
+
+
 def load_catalog() -> pd.DataFrame:
+    """Load catalog from Redis (см. load_catalog_snapshot)."""
+    return load_catalog_snapshot().df
+
+
+def load_catalog_snapshot(recheck_version: bool = False) -> CatalogSnapshot:
     """
     Load catalog from Redis.
 
     Redis содержит JSON массив объектов с полной структурой каталога
     (синхронизируется из 1C API каждый час).
 
+    Распарсенный каталог кешируется в памяти процесса и перечитывается
+    только после новой синхронизации (по last_sync из catalog:metadata,
+    которая проверяется не чаще раза в CATALOG_VERSION_CHECK_SECONDS).
+    Возвращаемый DataFrame общий для всех вызовов - не изменяйте его на месте.
+
+    Args:
+        recheck_version: Проверить версию в Redis сразу (после синхронизации)
+
     Returns:
-        DataFrame с каталогом товаров
+        CatalogSnapshot с каталогом товаров
     """
-    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")  # localhost для локальной разработки, переопределяется на redis:6379 в Docker
-    redis_key = "catalog:products"
-
     try:
-        # Подключаемся к Redis
-        r = redis.from_url(redis_url, encoding="utf-8", decode_responses=True)
-
-        # Получаем каталог
-        catalog_json = r.get(redis_key)
+        # Версия каталога = время последней синхронизации
+        version = _get_catalog_version(recheck_version)
 
-        if not catalog_json:
-            logger.warning("⚠️  Catalog not found in Redis, returning empty DataFrame")
-            return pd.DataFrame()
-
-        # Парсим JSON в список объектов
-        catalog_data = json.loads(catalog_json)
-
-        # Создаем DataFrame
-        df = pd.DataFrame(catalog_data)
-
-        logger.info(f"✅ Loaded {len(df)} items from Redis")
-        return df
+        if version:
+            with _snapshot_lock:
+                return _catalog_snapshot_for_version(version)
+        return _read_catalog_snapshot()
 
+    except LookupError:
+        logger.warning("⚠️  Catalog not found in Redis, returning empty DataFrame")
+        return _build_snapshot(pd.DataFrame())
     except Exception as e:
         logger.error(f"❌ Error loading catalog from Redis: {e}")
         # Возвращаем пустой DataFrame в случае ошибки
-        return pd.DataFrame()
-    finally:
-        try:
-            r.close()
-        except:
-            pass
+        return _build_snapshot(pd.DataFrame())
 
 
 def get_available_categories(df: pd.DataFrame) -> Dict[str, List[str]]:
@@ -116,121 +519,180 @@ def get_available_categories(df: pd.DataFrame) -> Dict[str, List[str]]:
     }
 
 
+# Нормализация текста для BM25: таблица и регулярки строятся один раз при импорте.
+# ё -> е ('ёлка' и 'елка' совпадают) и знак умножения -> пробел - за один проход str.translate
+_TOKEN_TABLE = str.maketrans({'ё': 'е', '×': ' '})
+# Разделитель размеров между числами (150x150, 13х115х6000 - латинская или русская "х")
+_DIMENSION_SEP_RE = re.compile(r'(?<=\d)\s*[xх*]\s*(?=\d)')
+# Длина в метрах в запросе ("6м", "3 метра", "2,5 м") - в каталоге длины в мм
+_METERS_RE = re.compile(r'\b(\d+(?:[.,]\d+)?)\s*(?:м|метр[а-я]*)\b')
+# Составные названия пишутся и слитно, и раздельно, и через дефис ("блок хаус",
+# "Блок-хаус", "блокхаус") - приводим к слитному написанию в каталоге и в запросе
+_COMPOUND_RE = re.compile(r'\b(блок|евро)[\s-]+(?=хаус|вагонк)')
+
+
+def _meters_to_mm(match: re.Match) -> str:
+    return f"{float(match.group(1).replace(',', '.')) * 1000:.0f}"
+
+
 def tokenize(text: str) -> List[str]:
-    """Simple tokenization for BM25."""
-    return str(text).lower().split()
+    """Tokenization for BM25: casefold, ё -> е, размеры "150x150" -> "150 150", "блок-хаус" -> "блокхаус"."""
+    text = _COMPOUND_RE.sub(r'\1', str(text).casefold().translate(_TOKEN_TABLE))
+    return _DIMENSION_SEP_RE.sub(' ', text).split()
+
+
+@lru_cache(maxsize=65536)
+def _tokenize_item_text(text: str) -> Tuple[str, ...]:
+    """
+    Токены текста товара. Синхронизация каталога меняет лишь часть товаров -
+    тексты остальных при сборке нового снимка берутся из кеша, а не токенизируются заново.
+    """
+    # intern: одинаковые токены разных товаров - один объект строки в памяти
+    return tuple(sys.intern(token) for token in tokenize(text))
+
+
+def tokenize_query(query: str) -> List[str]:
+    """Tokenization of a search query: как tokenize, плюс метры -> мм ("вагонка 6м" -> вагонка 6000)."""
+    return tokenize(_METERS_RE.sub(_meters_to_mm, str(query).casefold()))
+
+
+# Поля товара в ответе search_products_tool: (колонка, подпись)
+ITEM_PARAM_LABELS = (
+    ('Порода', 'Порода'),
+    ('Влажность', 'Влажность'),
+    ('Сорт', 'Сорт'),
+    ('Класс', 'Класс'),
+    ('Видпиломатериала', 'Вид'),
+    ('Типобработки', 'Обработка'),
+)
+ITEM_EXTRA_TEMPLATES = (
+    ('Допсвойство', "   Доп. свойство: {}"),
+    ('Плотностькгм3Общие', "   Плотность: {} кг/м³"),
+    ('Количествовм2Общие', "   В 1 шт: {} м²"),
+    ('Количествовм3Общие', "   В 1 шт: {} м³"),
+    ('СрокпроизводстваднОбщие', "   Срок производства: {} дней"),
+)
+
+def _row_filter_mask(
+    snapshot: CatalogSnapshot, params: ProductSearchParams, positions: np.ndarray
+) -> Optional[np.ndarray]:
+    """
+    Маска фильтров размеров и наличия для строк positions (None - фильтров нет).
+
+    Размеры и остатки разобраны один раз на снимок (CatalogSnapshot.dimensions/in_stock),
+    на запрос - только векторные сравнения. Диапазон цены сюда не входит - он
+    применяется отдельно через CatalogSnapshot.labels_in_price_range.
+    """
+    mask = None
+    for column, min_value, max_value in (
+        ('Толщина', params.thickness_min, params.thickness_max),
+        ('Ширина', params.width_min, params.width_max),
+        ('Длина', params.length_min, params.length_max),
+    ):
+        if min_value is None and max_value is None:
+            continue
+        values = snapshot.dimensions[column][positions]
+        # Сравнения с NaN дают False - нечисловые размеры отсеиваются
+        keep = np.ones(len(positions), dtype=bool)
+        if min_value is not None:
+            keep &= values >= min_value
+        if max_value is not None:
+            keep &= values <= max_value
+        mask = keep if mask is None else mask & keep
+
+    if params.in_stock_only:
+        keep = snapshot.in_stock[positions]
+        mask = keep if mask is None else mask & keep
+
+    return mask
 
 
 def search_products(params: ProductSearchParams) -> List[Dict[str, Any]]:
     """
     Search products with BM25 ranking and filtering.
 
-    Algorithm:
-    1. Load catalog
-    2. Apply categorical filters
-    3. Apply BM25 text search if query provided
-    4. Apply dimension/price filters
-    5. Return top-K results
+    Результат кешируется на снимке каталога по значениям params
+    (см. CatalogSnapshot.search); словари товаров общие - не изменяйте их.
     """
-    df = load_catalog()
-    results = df.copy()
-
-    # Apply categorical filters
-    if params.material_type:
-        results = results[results['Видпиломатериала'] == params.material_type]
-
-    if params.wood_species:
-        results = results[results['Порода'] == params.wood_species]
-
-    if params.grade:
-        results = results[results['Сорт'] == params.grade]
-
-    if params.moisture:
-        results = results[results['Влажность'] == params.moisture]
-
-    if params.treatment:
-        results = results[results['Типобработки'] == params.treatment]
-
-    if params.group_name:
-        results = results[results['group_name'] == params.group_name]
-
-    # Apply BM25 text search
-    if params.query and len(results) > 0:
-        # Build searchable corpus from multiple fields
-        corpus = []
-        for _, row in results.iterrows():
-            text_parts = []
-            for col in ['item_name', 'Наименование', 'Наименованиедлясайта']:
-                if col in row and pd.notna(row[col]):
-                    text_parts.append(str(row[col]))
-            corpus.append(' '.join(text_parts))
-
-        # Tokenize corpus
-        tokenized_corpus = [tokenize(doc) for doc in corpus]
-
-        # Build BM25 index
-        bm25 = BM25Okapi(tokenized_corpus)
-
-        # Get scores
-        tokenized_query = tokenize(params.query)
-        scores = bm25.get_scores(tokenized_query)
-
-        # Add scores to results
-        results = results.copy()
-        results['bm25_score'] = scores
-
-        # Sort by BM25 score descending
-        results = results.sort_values('bm25_score', ascending=False)
-
-    # Apply dimension filters
-    if params.thickness_min is not None or params.thickness_max is not None:
-        results['Толщина_float'] = results['Толщина'].apply(normalize_dimension)
-        if params.thickness_min is not None:
-            results = results[results['Толщина_float'] >= params.thickness_min]
-        if params.thickness_max is not None:
-            results = results[results['Толщина_float'] <= params.thickness_max]
-
-    if params.width_min is not None or params.width_max is not None:
-        results['Ширина_float'] = results['Ширина'].apply(normalize_dimension)
-        if params.width_min is not None:
-            results = results[results['Ширина_float'] >= params.width_min]
-        if params.width_max is not None:
-            results = results[results['Ширина_float'] <= params.width_max]
-
-    if params.length_min is not None or params.length_max is not None:
-        results['Длина_float'] = results['Длина'].apply(normalize_dimension)
-        if params.length_min is not None:
-            results = results[results['Длина_float'] >= params.length_min]
-        if params.length_max is not None:
-            results = results[results['Длина_float'] <= params.length_max]
-
-    # Apply price filters
-    if params.price_min is not None:
-        results['Цена_float'] = pd.to_numeric(results['Цена'], errors='coerce')
-        results = results[results['Цена_float'] >= params.price_min]
-    if params.price_max is not None:
-        if 'Цена_float' not in results.columns:
-            results['Цена_float'] = pd.to_numeric(results['Цена'], errors='coerce')
-        results = results[results['Цена_float'] <= params.price_max]
-
-    # Apply stock filter
-    if params.in_stock_only:
-        def has_stock(value):
-            if pd.isna(value):
-                return False
-            val_str = str(value).strip()
-            if val_str == 'По предзаказу':
-                return False
-            stock_val = normalize_dimension(val_str)
-            return stock_val > 0
+    return list(load_catalog_snapshot().search(astuple(params)))
 
-        results = results[results['Остаток'].apply(has_stock)]
 
-    # Apply limit and offset
-    results = results.iloc[params.offset:params.offset + params.limit]
+def _search_snapshot(snapshot: CatalogSnapshot, params: ProductSearchParams) -> List[Dict[str, Any]]:
+    """
+    Algorithm:
+    1. Apply categorical filters
+    2. Apply BM25 text search if query provided
+    3. Apply dimension/price filters
+    4. Return top-K results
+    """
+    # Значение, которого нет в каталоге, ничего не найдет - выходим без прохода по DataFrame
+    active_filters = []
+    for param_name, column in CATEGORICAL_FILTERS.items():
+        value = getattr(params, param_name)
+        if value:
+            if value not in snapshot.categories[column]:
+                return []
+            active_filters.append((column, value))
+
+    df = snapshot.df
+
+    # Выборка - позиции строк df; DataFrame строк собирается только для top-K в конце
+    if active_filters:
+        # Apply categorical filters (одной маской, без промежуточных DataFrame)
+        mask = pd.Series(True, index=df.index)
+        for column, value in active_filters:
+            mask &= df[column] == value
+        positions = np.flatnonzero(mask.to_numpy())
+    else:
+        positions = np.arange(len(df))
+
+    # Дальше выборка только сужается: пустая - сразу выходим (BM25 и фильтры не нужны)
+    if not len(positions):
+        return []
+
+    # Apply BM25 text search: score считается только по postings терминов запроса
+    # среди строк выборки; массив scores идет параллельно positions
+    scores = None
+    if params.query:
+        scores = snapshot.term_index.get_scores(positions, tokenize_query(params.query))
+
+    # Apply price filter: диапазон берется бинарным поиском по заранее
+    # отсортированным ценам, без разбора колонки 'Цена' на каждый запрос
+    if params.price_min is not None or params.price_max is not None:
+        price_labels = snapshot.labels_in_price_range(params.price_min, params.price_max)
+        keep = np.isin(positions, df.index.get_indexer(price_labels))
+        if not keep.any():
+            return []
+        positions = positions[keep]
+        scores = scores[keep] if scores is not None else None
+
+    # Apply dimension/stock filters: значения разобраны при загрузке снимка
+    keep = _row_filter_mask(snapshot, params, positions)
+    if keep is not None:
+        if not keep.any():
+            return []
+        positions = positions[keep]
+        scores = scores[keep] if scores is not None else None
 
-    # Convert to list of dicts
-    return results.to_dict('records')
+    # Apply limit and offset
+    end = params.offset + params.limit
+    if scores is None:
+        return df.iloc[positions[params.offset:end]].to_dict('records')
+
+    # Top-K по BM25 без полной сортировки: argpartition находит порог end-го результата,
+    # стабильно сортируются только кандидаты не ниже порога
+    k = min(end, len(scores))
+    if k <= 0:
+        return []
+    threshold = scores[np.argpartition(scores, -k)[-k]]
+    candidates = np.flatnonzero(scores >= threshold)
+    top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]][params.offset:]
+
+    # Только строки top-K превращаются в dict; score - последним полем, как колонка bm25_score
+    records = df.iloc[positions[top]].to_dict('records')
+    for record, score in zip(records, scores[top]):
+        record['bm25_score'] = float(score)
+    return records
 
 
 @tool
@@ -290,61 +752,44 @@ def search_products_tool(
     if not results:
         return "Товары не найдены. Попробуйте изменить параметры поиска."
 
-    # Format results with full product details
-    output = f"Найдено товаров: {len(results)}\n\n"
+    # Format results with full product details (строки собираем в список и склеиваем один раз)
+    lines = [f"Найдено товаров: {len(results)}\n"]
+    append = lines.append
     for i, item in enumerate(results[:15], 1):
-        output += f"{i}. {item.get('Наименованиедлясайта', item.get('item_name', 'N/A'))}\n"
+        get = item.get
+        append(f"{i}. {get('Наименованиедлясайта', get('item_name', 'N/A'))}")
 
         # Основная информация - используем group_code который работает с 1С API
-        output += f"   Код: {item.get('group_code', 'N/A')}\n"
-        output += f"   Цена: {item.get('Цена', 'N/A')} руб.\n"
+        append(f"   Код: {get('group_code', 'N/A')}")
+        append(f"   Цена: {get('Цена', 'N/A')} руб.")
 
         # Параметры материала
-        if pd.notna(item.get('Порода')):
-            output += f"   Порода: {item.get('Порода')}\n"
-        if pd.notna(item.get('Влажность')):
-            output += f"   Влажность: {item.get('Влажность')}\n"
-        if pd.notna(item.get('Сорт')):
-            output += f"   Сорт: {item.get('Сорт')}\n"
-        if pd.notna(item.get('Класс')):
-            output += f"   Класс: {item.get('Класс')}\n"
-        if pd.notna(item.get('Видпиломатериала')):
-            output += f"   Вид: {item.get('Видпиломатериала')}\n"
-        if pd.notna(item.get('Типобработки')):
-            output += f"   Обработка: {item.get('Типобработки')}\n"
+        for key, label in ITEM_PARAM_LABELS:
+            value = get(key)
+            if pd.notna(value):
+                append(f"   {label}: {value}")
 
         # Размеры
-        dimensions = []
-        if pd.notna(item.get('Толщина')):
-            dimensions.append(f"{item.get('Толщина')}")
-        if pd.notna(item.get('Ширина')):
-            dimensions.append(f"{item.get('Ширина')}")
-        if pd.notna(item.get('Длина')):
-            dimensions.append(f"{item.get('Длина')}")
+        dimensions = [f"{get(key)}" for key in ('Толщина', 'Ширина', 'Длина') if pd.notna(get(key))]
         if dimensions:
-            output += f"   Размеры (мм): {' x '.join(dimensions)}\n"
+            append(f"   Размеры (мм): {' x '.join(dimensions)}")
 
         # Дополнительные параметры
-        if pd.notna(item.get('Допсвойство')):
-            output += f"   Доп. свойство: {item.get('Допсвойство')}\n"
-        if pd.notna(item.get('Плотностькгм3Общие')):
-            output += f"   Плотность: {item.get('Плотностькгм3Общие')} кг/м³\n"
-        if pd.notna(item.get('Количествовм2Общие')):
-            output += f"   В 1 шт: {item.get('Количествовм2Общие')} м²\n"
-        if pd.notna(item.get('Количествовм3Общие')):
-            output += f"   В 1 шт: {item.get('Количествовм3Общие')} м³\n"
-        if pd.notna(item.get('СрокпроизводстваднОбщие')):
-            output += f"   Срок производства: {item.get('СрокпроизводстваднОбщие')} дней\n"
-        if pd.notna(item.get('ПопулярностьОбщие')) and float(item.get('ПопулярностьОбщие', 0)) > 0:
-            output += f"   ⭐ Популярность: {item.get('ПопулярностьОбщие')}\n"
+        for key, template in ITEM_EXTRA_TEMPLATES:
+            value = get(key)
+            if pd.notna(value):
+                append(template.format(value))
+        popularity = get('ПопулярностьОбщие')
+        if pd.notna(popularity) and float(popularity) > 0:
+            append(f"   ⭐ Популярность: {popularity}")
 
         # Релевантность (если есть)
         if 'bm25_score' in item:
-            output += f"   Релевантность: {item['bm25_score']:.2f}\n"
+            append(f"   Релевантность: {item['bm25_score']:.2f}")
 
-        output += "\n"
+        append("")
 
-    return output
+    return "\n".join(lines) + "\n"
 
 
 if __name__ == '__main__':
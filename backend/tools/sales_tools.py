@@ -2,20 +2,25 @@
 Инструменты для активных продаж и взаимодействия с менеджером.
 Включает вызов менеджера и сбор данных для оформления заказа с отправкой на Email в красивом HTML формате.
 """
+import io
 import os
 import asyncio
 import logging
+from dataclasses import dataclass, field
 from typing import Optional, Dict, List
+from email import policy
+from email.generator import BytesGenerator
 from email.message import EmailMessage
 
 import aiosmtplib
 from langchain.tools import tool
 from langchain_core.tools import InjectedToolArg
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from typing import Annotated
 
 # Импортируем утилиты для расчета цен с учетом единиц измерения
 from utils.price_calculator import parse_unit, calculate_price_per_piece
+from tools.get_product_live_details import fetch_live_product_details
 
 logger = logging.getLogger(__name__)
 
@@ -24,26 +29,44 @@ BRAND_GREEN = "#26a65b"
 BRAND_DARK = "#333333"
 BG_LIGHT = "#f8f9fa"
 
+# Дедлайн на обогащение заказа из 1С внутри tool (секунды)
+ORDER_ENRICH_TIMEOUT_SECONDS = float(os.getenv("ORDER_ENRICH_TIMEOUT_SECONDS", "10"))
+
+# Константы форматирования (строятся один раз, а не на каждый вызов)
+_DASH = "—"
+_RUB_CODES = frozenset(("RUB", "RUR", "₽"))
+_COMMA_TO_SPACE = str.maketrans({",": " "})
+
+# Единицы измерения для пересчета цен заказа
+_PIECE_UNIT_ALIASES = frozenset(("штук", "штука", "шт."))
+_VOLUME_AREA_UNITS = frozenset(("м3", "м2", "м³", "м²"))
+
+
 def _fmt_money(amount: Optional[float], currency: str = "RUB") -> str:
     if amount is None:
-        return "—"
-    try:
-        value = float(amount)
-    except Exception:
-        return str(amount)
-    if currency.upper() in ("RUB", "RUR", "₽"):
-        return f"{value:,.2f} ₽".replace(",", " ")
-    return f"{value:,.2f} {currency}".replace(",", " ")
+        return _DASH
+    if type(amount) is float or type(amount) is int:
+        value = amount
+    else:
+        try:
+            value = float(amount)
+        except Exception:
+            return str(amount)
+    suffix = "₽" if currency.upper() in _RUB_CODES else currency
+    return f"{value:,.2f} {suffix}".translate(_COMMA_TO_SPACE)
 
 
 def _fmt_qty(qty: Optional[float], unit: Optional[str] = None) -> str:
     if qty is None:
-        return "—"
-    try:
-        q = float(qty)
-        s = (f"{q:.3f}".rstrip("0").rstrip(".")) or "0"
-    except Exception:
+        return _DASH
+    if type(qty) is int:
         s = str(qty)
+    else:
+        try:
+            q = float(qty)
+            s = (f"{q:.3f}".rstrip("0").rstrip(".")) or "0"
+        except Exception:
+            s = str(qty)
     return f"{s} {unit}".strip() if unit else s
 
 
@@ -175,10 +198,10 @@ def _fetch_products_from_1c_sync(product_codes: List[str]) -> Dict[str, dict]:
         return {}
 
     try:
-        # Импортируем функцию из get_product_live_details
-        from tools.get_product_live_details import fetch_live_product_details
-
-        items = fetch_live_product_details(product_codes)
+        # Результат - словарь по коду, порядок не важен: сортируем коды, чтобы
+        # одинаковые наборы в разном порядке попадали в один ключ TTL-кеша
+        # и в один запрос в полете (single-flight) в fetch_live_product_details
+        items = fetch_live_product_details(sorted(set(product_codes)))
         out: Dict[str, dict] = {}
 
         for item in items:
@@ -239,25 +262,27 @@ def enrich_and_calculate_order_sync(order: "OrderInfo") -> "OrderInfo":
     if not order.items:
         return order
 
-    # Проверяем что у всех позиций есть product_code
-    missing_codes = [it.product_name for it in order.items if not it.product_code]
+    # Один проход по позициям: проверяем, что у всех есть product_code,
+    # и собираем уникальные коды для 1С (dict сохраняет порядок)
+    missing_codes: List[str] = []
+    codes_unique: Dict[str, None] = {}
+    for it in order.items:
+        if it.product_code:
+            codes_unique[it.product_code] = None
+        else:
+            missing_codes.append(it.product_name)
+
     if missing_codes:
         raise ValueError(
             "Для расчёта заказа нужны коды номенклатуры (product_code) по каждой позиции. "
             f"Нет кода у: {', '.join(missing_codes[:5])}"
         )
 
-    # Получаем данные из 1С (теперь получаем ВСЕ поля)
-    need_codes = [it.product_code for it in order.items if it.product_code]
-    codes_unique = list(dict.fromkeys([c for c in need_codes if c]))
-
     if codes_unique:
-        products = _fetch_products_from_1c_sync(codes_unique)
+        # Получаем данные из 1С (теперь получаем ВСЕ поля)
+        products = _fetch_products_from_1c_sync(list(codes_unique))
 
         for it in order.items:
-            if not it.product_code:
-                continue
-
             product_data = products.get(it.product_code)
             if not product_data:
                 logger.warning(f"Товар {it.product_code} не найден в 1С")
@@ -281,7 +306,7 @@ def enrich_and_calculate_order_sync(order: "OrderInfo") -> "OrderInfo":
 
                 # Нормализуем единицу клиента
                 client_unit = (it.unit or "шт").lower().strip()
-                client_unit_normalized = client_unit if client_unit not in ["штук", "штука", "шт."] else "шт"
+                client_unit_normalized = client_unit if client_unit not in _PIECE_UNIT_ALIASES else "шт"
 
                 logger.info(f"💰 Price conversion for {it.product_name} ({it.product_code}):")
                 logger.info(f"   Base price from 1C: {base_price_float} ₽/{base_unit}")
@@ -289,7 +314,7 @@ def enrich_and_calculate_order_sync(order: "OrderInfo") -> "OrderInfo":
                 logger.info(f"   Client wants: {it.quantity} {client_unit}")
 
                 # Случай 1: Клиент заказывает в штуках, а товар в м³/м²
-                if client_unit_normalized == "шт" and base_unit in ["м3", "м2", "м³", "м²"]:
+                if client_unit_normalized == "шт" and base_unit in _VOLUME_AREA_UNITS:
                     if pieces_per_unit and pieces_per_unit > 0:
                         # Рассчитываем цену за штуку
                         price_per_piece = base_price_float / pieces_per_unit
@@ -301,7 +326,7 @@ def enrich_and_calculate_order_sync(order: "OrderInfo") -> "OrderInfo":
                         logger.warning(f"   ⚠️  No conversion coefficient, using base price")
 
                 # Случай 2: Единицы совпадают или клиент заказывает в той же ЕИ
-                elif client_unit_normalized == base_unit or client_unit_normalized in ["м3", "м2", "м³", "м²"] and base_unit in ["м3", "м2", "м³", "м²"]:
+                elif client_unit_normalized == base_unit or client_unit_normalized in _VOLUME_AREA_UNITS and base_unit in _VOLUME_AREA_UNITS:
                     it.unit_price = base_price_float
                     logger.info(f"   ✅ Units match, using base price: {it.unit_price} ₽/{base_unit}")
 
@@ -315,14 +340,162 @@ def enrich_and_calculate_order_sync(order: "OrderInfo") -> "OrderInfo":
                     it.unit_price = base_price_float
                     logger.warning(f"   ⚠️  Unknown conversion {client_unit} -> {base_unit}, using base price")
 
-    return _calculate_order_totals(order)
+    order = _calculate_order_totals(order)
+    # Форматируем позиции/итоги один раз — дальше письма только склеивают строки
+    order._rendered = _render_order(order)
+    return order
+
+
+@dataclass
+class _RenderedOrder:
+    """Предрасчитанные текстовые блоки заказа (позиции + итоги) для писем."""
+
+    item_lines: List[str] = field(default_factory=list)
+    has_missing_prices: bool = False
+    pricing_lines: List[str] = field(default_factory=list)
+
+
+async def _enrich_order_within_budget(order: "OrderInfo") -> "OrderInfo":
+    """
+    Обогащение заказа из 1С в потоке с общим дедлайном ORDER_ENRICH_TIMEOUT_SECONDS.
+
+    Поток работает с копией заказа: если 1С не уложилась в бюджет, поток
+    дорабатывает в фоне, а мы продолжаем с исходным заказом (итоги по тем
+    ценам, что уже есть) - агент не висит на медленной 1С.
+    """
+    try:
+        return await asyncio.wait_for(
+            asyncio.to_thread(enrich_and_calculate_order_sync, order.model_copy(deep=True)),
+            timeout=ORDER_ENRICH_TIMEOUT_SECONDS,
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Order enrichment exceeded {ORDER_ENRICH_TIMEOUT_SECONDS}s, continuing without 1C prices")
+        return _calculate_order_totals(order)
+
+
+def _render_order(order: "OrderInfo") -> _RenderedOrder:
+    """Один раз форматирует позиции и итоги заказа."""
+    rendered = _RenderedOrder()
+    if not order.items:
+        return rendered
+
+    cur = (order.pricing.currency if order.pricing else "RUB")
+    for i, it in enumerate(order.items, start=1):
+        code = f" (код: {it.product_code})" if it.product_code else ""
+        qty = _fmt_qty(it.quantity, it.unit)
+
+        # Если нет цены - показываем "Уточнить"
+        if it.unit_price is None:
+            price = "Уточнить"
+            total = "Уточнить"
+            rendered.has_missing_prices = True
+        else:
+            price = _fmt_money(it.unit_price, cur)
+            total = _fmt_money(it.line_total, cur) if it.line_total is not None else "Уточнить"
+
+        extra = f" | {it.availability}" if it.availability else ""
+        rendered.item_lines.append(f"{i}. {it.product_name}{code} — {qty} × {price} = {total}{extra}")
+        if it.comment:
+            rendered.item_lines.append(f"   примечание: {it.comment}")
+
+    if order.pricing:
+        p = order.pricing
+        pcur = p.currency or "RUB"
+        rendered.pricing_lines.append(f"Сумма позиций: {_fmt_money(p.subtotal, pcur)}")
+        if p.delivery_cost:
+            rendered.pricing_lines.append(f"Доставка: {_fmt_money(p.delivery_cost, pcur)}")
+        if p.discount:
+            rendered.pricing_lines.append(f"Скидка: {_fmt_money(p.discount, pcur)}")
+        rendered.pricing_lines.append(f"Итого: {_fmt_money(p.total, pcur)}")
+        if p.payment_terms:
+            rendered.pricing_lines.append(f"Оплата: {p.payment_terms}")
+    return rendered
+
+
+def _get_rendered_order(order: "OrderInfo") -> _RenderedOrder:
+    """Возвращает блоки, посчитанные при обогащении, или форматирует заказ сейчас."""
+    if order._rendered is None:
+        order._rendered = _render_order(order)
+    return order._rendered
+
+
+def _format_dialogue_summary(ds: Optional[DialogueSummary]) -> str:
+    """Текстовый блок детального саммари диалога для письма."""
+    if not ds:
+        return ""
+    blocks: List[str] = [ds.summary]
+    if ds.key_points:
+        blocks.append("Ключевые моменты:\n- " + "\n- ".join(ds.key_points))
+    if ds.open_questions:
+        blocks.append("Нужно уточнить:\n- " + "\n- ".join(ds.open_questions))
+    if ds.next_steps:
+        blocks.append("Следующие шаги:\n- " + "\n- ".join(ds.next_steps))
+    return "\n\n".join(blocks)
+
+
+def _prepare_static_fields(order: "OrderInfo") -> Dict[str, str]:
+    """
+    Части письма о заказе, которые не зависят от цен из 1С
+    (тема, саммари, канал).
+    """
+    # Определяем основной товар для темы письма
+    main_product = order.items[0].product_name if order.items else "Товар"
+    volume = _fmt_qty(order.items[0].quantity, order.items[0].unit) if order.items else _DASH
+
+    # Формируем информацию о канале связи
+    channel_info = ""
+    if order.channel_source:
+        channel_info = order.channel_source
+        if order.contact_username:
+            channel_info += f" (@{order.contact_username})"
+
+    return {
+        "main_product": main_product,
+        "subject": f"ЗАКАЗ | {main_product} | {volume} | {order.client_name}",
+        "dialogue_text": _format_dialogue_summary(order.dialogue_summary),
+        "channel_info": channel_info,
+    }
+
+
+def _build_email_bytes(to_addr: str, subject: str, text_body: str, html_body: str) -> bytes:
+    """
+    Собирает письмо (plain + HTML) и сразу сериализует его в байты для SMTP.
+    aiosmtplib отправляет готовые байты как есть, без повторного прохода email.generator.
+    """
+    message = EmailMessage()
+    message["From"] = os.getenv("SMTP_USER")
+    message["To"] = to_addr
+    message["Subject"] = subject
+    message.set_content(text_body)
+    message.add_alternative(html_body, subtype='html')
+
+    buf = io.BytesIO()
+    BytesGenerator(buf, policy=policy.SMTP).flatten(message)
+    return buf.getvalue()
+
+
+async def _send_email_bytes(raw: bytes, to_addr: str) -> None:
+    """Отправляет предварительно сериализованное письмо через SMTP."""
+    smtp_port = int(os.getenv("SMTP_PORT", "587"))
+    # Port 465 uses SSL, port 587 uses STARTTLS
+    tls_kwargs = {"use_tls": True} if smtp_port == 465 else {"start_tls": True}
+    await aiosmtplib.send(
+        raw,
+        sender=os.getenv("SMTP_USER"),
+        recipients=[to_addr],
+        hostname=os.getenv("SMTP_SERVER"),
+        port=smtp_port,
+        username=os.getenv("SMTP_USER"),
+        password=os.getenv("SMTP_PASSWORD"),
+        **tls_kwargs,
+    )
 
 
 def render_email_html(title: str, subtitle: str, fields: Dict[str, str], footer_text: str) -> str:
     """Генерирует красивый структурированный HTML-шаблон с улучшенным дизайном."""
     items_html = ""
     for label, value in fields.items():
-        if value and value.strip() and value != "—":  # Skip empty values and dashes
+        if value and value.strip() and value != _DASH:  # Skip empty values and dashes
             # Специальная обработка для "Позиции заказа" и блоков с переносами строк
             if label in ("Позиции заказа", "Заказ / позиции", "Цены / Итоги", "Саммари диалога", "Детальное саммари"):
                 value_html = value.replace('\n', '<br>')
@@ -413,6 +586,9 @@ class OrderInfo(BaseModel):
     delivery_method: Optional[str] = Field(None, description="Доставка/самовывоз/ТК и т.п., если обсуждалось")
     additional_comments: Optional[str] = Field(None, description="Дополнительные пожелания клиента")
 
+    # Кеш отформатированных блоков (заполняется в enrich_and_calculate_order_sync)
+    _rendered: Optional[_RenderedOrder] = PrivateAttr(default=None)
+
 class ManagerHandover(BaseModel):
     client_summary: str = Field(description="Краткое описание того, что хочет клиент и на чем остановился диалог")
 
@@ -431,6 +607,12 @@ class ManagerHandover(BaseModel):
         description="Если в диалоге уже есть конкретика по заказу — приложи структуру заказа (позиции/цены/итоги). Цены/итоги посчитаются автоматически",
     )
 
+
+# Достраиваем схемы моделей-аргументов tools при импорте: валидация
+# первого вызова tool не должна платить за отложенную сборку схемы.
+for _model in (OrderLineItem, OrderPricing, DialogueSummary, OrderInfo, ManagerHandover):
+    _model.model_rebuild()
+
 @tool
 async def call_manager(handover: ManagerHandover) -> str:
     """
@@ -448,10 +630,10 @@ async def call_manager(handover: ManagerHandover) -> str:
     if not sales_email:
         return "Ошибка конфигурации: почта отдела продаж не настроена."
 
-    # Обогащаем order если есть
+    # Обогащаем order если есть (запрос в 1С блокирующий — идет в потоке)
     if handover.order and handover.order.items:
         try:
-            handover.order = enrich_and_calculate_order_sync(handover.order)
+            handover.order = await _enrich_order_within_budget(handover.order)
         except Exception as e:
             logger.warning(f"Failed to enrich/calculate handover order: {repr(e)}")
 
@@ -460,56 +642,17 @@ async def call_manager(handover: ManagerHandover) -> str:
 
     subject = f"ВЫЗОВ МЕНЕДЖЕРА | {priority_label} | {handover.main_topic} | {handover.client_name}"
 
-    detailed_summary = ""
-    if handover.dialogue_summary:
-        ds = handover.dialogue_summary
-        blocks: List[str] = [ds.summary]
-        if ds.key_points:
-            blocks.append("Ключевые моменты:\n- " + "\n- ".join(ds.key_points))
-        if ds.open_questions:
-            blocks.append("Нужно уточнить:\n- " + "\n- ".join(ds.open_questions))
-        if ds.next_steps:
-            blocks.append("Следующие шаги:\n- " + "\n- ".join(ds.next_steps))
-        detailed_summary = "\n\n".join(blocks)
+    detailed_summary = _format_dialogue_summary(handover.dialogue_summary)
 
     order_block = ""
     if handover.order and handover.order.items:
-        order = handover.order
-        lines: List[str] = []
-        cur = (order.pricing.currency if order.pricing else "RUB")
-        has_missing_prices = False
-
-        for i, it in enumerate(order.items, start=1):
-            code = f" (код: {it.product_code})" if it.product_code else ""
-            qty = _fmt_qty(it.quantity, it.unit)
-
-            # Если нет цены - показываем "Уточнить"
-            if it.unit_price is None:
-                price = "Уточнить"
-                total = "Уточнить"
-                has_missing_prices = True
-            else:
-                price = _fmt_money(it.unit_price, cur)
-                total = _fmt_money(it.line_total, cur) if it.line_total is not None else "Уточнить"
-
-            extra = f" | {it.availability}" if it.availability else ""
-            lines.append(f"{i}. {it.product_name}{code} — {qty} × {price} = {total}{extra}")
-            if it.comment:
-                lines.append(f"   примечание: {it.comment}")
-
-        if has_missing_prices:
+        rendered = _get_rendered_order(handover.order)
+        lines: List[str] = list(rendered.item_lines)
+        if rendered.has_missing_prices:
             lines.append("\n⚠️ Некоторые позиции требуют уточнения цены")
-        if order.pricing:
-            p = order.pricing
+        if rendered.pricing_lines:
             lines.append("")
-            lines.append(f"Сумма позиций: {_fmt_money(p.subtotal, cur)}")
-            if p.delivery_cost:
-                lines.append(f"Доставка: {_fmt_money(p.delivery_cost, cur)}")
-            if p.discount:
-                lines.append(f"Скидка: {_fmt_money(p.discount, cur)}")
-            lines.append(f"Итого: {_fmt_money(p.total, cur)}")
-            if p.payment_terms:
-                lines.append(f"Оплата: {p.payment_terms}")
+            lines.extend(rendered.pricing_lines)
         order_block = "\n".join(lines).strip()
 
     fields = {
@@ -529,24 +672,15 @@ async def call_manager(handover: ManagerHandover) -> str:
         "Сообщение сформировано автоматически ИИ-ассистентом СтройАссортимент"
     )
 
-    message = EmailMessage()
-    message["From"] = os.getenv("SMTP_USER")
-    message["To"] = sales_email
-    message["Subject"] = subject
-    message.set_content(f"Вызов менеджера: {handover.client_name} - {handover.main_topic}")
-    message.add_alternative(html_body, subtype='html')
+    raw_message = _build_email_bytes(
+        sales_email,
+        subject,
+        f"Вызов менеджера: {handover.client_name} - {handover.main_topic}",
+        html_body,
+    )
 
     try:
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        # Port 465 uses SSL, port 587 uses STARTTLS
-        if smtp_port == 465:
-            await aiosmtplib.send(message, hostname=os.getenv("SMTP_SERVER"), port=smtp_port,
-                                 username=os.getenv("SMTP_USER"), password=os.getenv("SMTP_PASSWORD"),
-                                 use_tls=True)
-        else:
-            await aiosmtplib.send(message, hostname=os.getenv("SMTP_SERVER"), port=smtp_port,
-                                 username=os.getenv("SMTP_USER"), password=os.getenv("SMTP_PASSWORD"),
-                                 start_tls=True)
+        await _send_email_bytes(raw_message, sales_email)
         return "Менеджер получил ваш запрос и сейчас изучает историю переписки. Он ответит вам в ближайшее время."
     except Exception as e:
         logger.error(f"Handover error: {e}")
@@ -594,7 +728,7 @@ async def collect_order_info(
 
     # Обогащаем заказ данными из 1С и считаем итоги
     try:
-        order = enrich_and_calculate_order_sync(order)
+        order = await _enrich_order_within_budget(order)
         logger.info(f"Order enriched and calculated successfully")
     except Exception as e:
         logger.warning(f"Failed to enrich/calculate order: {repr(e)}")
@@ -606,86 +740,27 @@ async def collect_order_info(
 
     logger.info(f"Сбор заказа: клиент={order.client_name}, позиций={len(order.items)}")
 
-    # Определяем основной товар для темы письма
-    main_product = order.items[0].product_name if order.items else "Товар"
-    volume = _fmt_qty(order.items[0].quantity, order.items[0].unit) if order.items else "—"
-
-    subject = f"ЗАКАЗ | {main_product} | {volume} | {order.client_name}"
-
-    # Формируем список позиций (ВСЕ позиции, даже без цены)
-    items_text = ""
-    if order.items:
-        cur = (order.pricing.currency if order.pricing else "RUB")
-        parts: List[str] = []
-        has_missing_prices = False
-
-        for i, it in enumerate(order.items, start=1):
-            code = f" (код: {it.product_code})" if it.product_code else ""
-            qty = _fmt_qty(it.quantity, it.unit)
-
-            # Если нет цены - показываем "Уточнить у менеджера"
-            if it.unit_price is None:
-                price = "Уточнить"
-                total = "Уточнить"
-                has_missing_prices = True
-            else:
-                price = _fmt_money(it.unit_price, cur)
-                total = _fmt_money(it.line_total, cur) if it.line_total is not None else "Уточнить"
-
-            extra = f" | {it.availability}" if it.availability else ""
-            parts.append(f"{i}. {it.product_name}{code} — {qty} × {price} = {total}{extra}")
-            if it.comment:
-                parts.append(f"   примечание: {it.comment}")
+    static_fields = _prepare_static_fields(order)
+    main_product = static_fields["main_product"]
+    subject = static_fields["subject"]
 
-        items_text = "\n".join(parts)
+    # Формируем список позиций (ВСЕ позиции, даже без цены) и итоги
+    rendered = _get_rendered_order(order)
+    items_text = "\n".join(rendered.item_lines)
 
-        # Если есть позиции без цен - добавляем примечание
-        if has_missing_prices:
-            items_text += "\n\n⚠️ Некоторые позиции требуют уточнения цены у менеджера"
-
-    # Формируем итоги
-    pricing_text = ""
-    if order.pricing:
-        p = order.pricing
-        cur = p.currency or "RUB"
-        pricing_lines = [
-            f"Сумма позиций: {_fmt_money(p.subtotal, cur)}",
-        ]
-        if p.delivery_cost:
-            pricing_lines.append(f"Доставка: {_fmt_money(p.delivery_cost, cur)}")
-        if p.discount:
-            pricing_lines.append(f"Скидка: {_fmt_money(p.discount, cur)}")
-        pricing_lines.append(f"Итого: {_fmt_money(p.total, cur)}")
-        if p.payment_terms:
-            pricing_lines.append(f"Оплата: {p.payment_terms}")
-        pricing_text = "\n".join(pricing_lines)
-
-    dialogue_text = ""
-    if order.dialogue_summary:
-        ds = order.dialogue_summary
-        blocks: List[str] = [ds.summary]
-        if ds.key_points:
-            blocks.append("Ключевые моменты:\n- " + "\n- ".join(ds.key_points))
-        if ds.open_questions:
-            blocks.append("Нужно уточнить:\n- " + "\n- ".join(ds.open_questions))
-        if ds.next_steps:
-            blocks.append("Следующие шаги:\n- " + "\n- ".join(ds.next_steps))
-        dialogue_text = "\n\n".join(blocks)
+    # Если есть позиции без цен - добавляем примечание
+    if rendered.has_missing_prices:
+        items_text += "\n\n⚠️ Некоторые позиции требуют уточнения цены у менеджера"
 
-    # Формируем информацию о канале связи
-    channel_info = ""
-    if order.channel_source:
-        channel_info = order.channel_source
-        if order.contact_username:
-            channel_info += f" (@{order.contact_username})"
+    pricing_text = "\n".join(rendered.pricing_lines)
 
     fields = {
         "Клиент": order.client_name,
         "Контакты": order.client_contact,
-        "Канал связи": channel_info or "—",
+        "Канал связи": static_fields["channel_info"] or _DASH,
         "Позиции заказа": items_text,
         "Цены / Итоги": pricing_text,
-        "Саммари диалога": dialogue_text,
+        "Саммари диалога": static_fields["dialogue_text"],
         "Адрес доставки": order.delivery_address or "Самовывоз",
         "Способ получения": order.delivery_method or "",
         "Дополнительно": order.additional_comments or ""
@@ -698,25 +773,16 @@ async def collect_order_info(
         "Заявка сформирована автоматически ИИ-ассистентом СтройАссортимент"
     )
 
-    message = EmailMessage()
-    message["From"] = os.getenv("SMTP_USER")
-    message["To"] = sales_email
-    message["Subject"] = subject
-    message.set_content(f"Новый заказ: {order.client_name} - {main_product}")
-    message.add_alternative(html_body, subtype='html')
+    raw_message = _build_email_bytes(
+        sales_email,
+        subject,
+        f"Новый заказ: {order.client_name} - {main_product}",
+        html_body,
+    )
 
     try:
         logger.info(f"Отправка email на {sales_email}...")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        # Port 465 uses SSL, port 587 uses STARTTLS
-        if smtp_port == 465:
-            await aiosmtplib.send(message, hostname=os.getenv("SMTP_SERVER"), port=smtp_port,
-                                 username=os.getenv("SMTP_USER"), password=os.getenv("SMTP_PASSWORD"),
-                                 use_tls=True)
-        else:
-            await aiosmtplib.send(message, hostname=os.getenv("SMTP_SERVER"), port=smtp_port,
-                                 username=os.getenv("SMTP_USER"), password=os.getenv("SMTP_PASSWORD"),
-                                 start_tls=True)
+        await _send_email_bytes(raw_message, sales_email)
         logger.info("Email успешно отправлен.")
         await _persist_order_submission(order, status="SENT")
         return f"Благодарю, {order.client_name}! Ваша заявка отправлена в отдел продаж. Менеджер свяжется с вами в ближайшее время для уточнения деталей и подтверждения заказа."
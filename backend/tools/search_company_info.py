@@ -2,50 +2,156 @@
 BM25-based search tool for company knowledge base.
 Searches through sections using BM25 ranking on keywords and content.
 """
-import json
-from typing import List, Dict, Any
-from rank_bm25 import BM25Okapi
+import re
+import sys
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
 from langchain.tools import tool
 
+from utils.kb_parser import STOP_WORDS
+
+
+# Параметры BM25 - те же, что у rank_bm25.BM25Okapi по умолчанию
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+
+
+@dataclass
+class KBIndex:
+    """BM25 индекс базы знаний и метаданные разделов (строятся один раз на версию KB)."""
+
+    section_keys: List[str]
+    sections: List[Dict[str, Any]]
+    # Инвертированный индекс в CSR-виде: postings термина term_ids[t] лежат в
+    # doc_ids/contributions[indptr[t]:indptr[t + 1]] - номера разделов и готовые BM25-вклады
+    term_ids: Dict[str, int]
+    indptr: np.ndarray
+    doc_ids: np.ndarray
+    contributions: np.ndarray
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """BM25 score всех разделов: один векторный проход по postings терминов запроса."""
+        n_docs = len(self.section_keys)
+        ids = np.array(
+            [self.term_ids[token] for token in query_tokens if token in self.term_ids],
+            dtype=np.intp,
+        )
+        if not len(ids):
+            return np.zeros(n_docs)
+
+        # Позиции всех postings запроса одним массивом (склейка диапазонов indptr без цикла)
+        starts = self.indptr[ids]
+        lengths = self.indptr[ids + 1] - starts
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        return np.bincount(
+            self.doc_ids[positions],
+            weights=self.contributions[positions],
+            minlength=n_docs,
+        )
+
+
+# Кеш индекса: (версия KB, KBIndex). Версия - хеш текста KB из ParamsManager,
+# поэтому индекс перестраивается только после изменения базы знаний.
+_KB_INDEX_CACHE: Optional[Tuple[str, KBIndex]] = None
+# Tool вызывается из потоков агента: индекс новой версии строит только один из них
+_KB_INDEX_LOCK = threading.Lock()
+
+
+# Токен - непрерывная последовательность букв/цифр (Unicode)
+_TOKEN_RE = re.compile(r"\w+")
+# Стоп-слова из парсера KB, в той же нормализации (ё -> е), что и токены
+_STOP_WORDS = frozenset(word.replace("ё", "е") for word in STOP_WORDS)
+
 
 def tokenize(text: str) -> List[str]:
-    """Simple tokenization for BM25."""
-    return str(text).lower().split()
+    """
+    Tokenization for BM25: слова без пунктуации, ё -> е, без русских стоп-слов.
+    Одна и та же функция для разделов KB и запроса - словари совпадают.
+    """
+    text = text.lower() if isinstance(text, str) else str(text).lower()
+    return [
+        token for token in _TOKEN_RE.findall(text.replace("ё", "е"))
+        if token not in _STOP_WORDS
+    ]
 
 
-def build_searchable_text(section_data: dict) -> str:
-    """Build searchable text from section data (keywords + title + content)."""
-    parts = []
+@lru_cache(maxsize=1024)
+def _tokenize_section_text(text: str) -> Tuple[str, ...]:
+    """
+    Токены поля раздела по его тексту. При обновлении KB обычно меняется один-два
+    раздела - остальные берутся из кеша, а не токенизируются заново.
+    """
+    # intern: одинаковые токены разных разделов - один объект строки в памяти
+    return tuple(sys.intern(token) for token in tokenize(text))
+
+
+# Веса полей раздела (BM25F): токен заголовка засчитывается 3 раза,
+# ключевого слова - 2, содержимого - 1 (вместо повторения текста полей)
+TITLE_WEIGHT = 3
+KEYWORDS_WEIGHT = 2
+CONTENT_WEIGHT = 1
+
+
+def section_term_frequencies(section_data: dict) -> Counter:
+    """
+    Взвешенные частоты терминов раздела: tf = 3*tf(title) + 2*tf(keywords) + tf(content).
+    Каждое поле токенизируется один раз; длина документа для BM25 - сумма частот.
+    """
+    fields = []
 
-    # Add title (high weight - repeat 3x)
     title = section_data.get("title", "")
     if title:
-        parts.extend([title] * 3)
+        fields.append((title, TITLE_WEIGHT))
 
-    # Add keywords (high weight - repeat 2x)
     keywords = section_data.get("keywords", [])
     if keywords:
-        keyword_text = " ".join(keywords)
-        parts.extend([keyword_text] * 2)
+        fields.append((" ".join(keywords), KEYWORDS_WEIGHT))
 
-    # Add content (lower weight - 1x)
     content = section_data.get("content", {})
     if content:
-        content_str = json.dumps(content, ensure_ascii=False)
-        parts.append(content_str)
+        fields.append((" ".join(_iter_text_leaves(content)), CONTENT_WEIGHT))
+
+    term_freqs: Counter = Counter()
+    for text, weight in fields:
+        for token, count in Counter(_tokenize_section_text(text)).items():
+            term_freqs[token] += count * weight
+    return term_freqs
+
 
-    return " ".join(parts)
+def _iter_text_leaves(value: Any) -> Iterator[str]:
+    """Текстовые значения (и ключи словарей) содержимого раздела - без сериализации в JSON."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield str(key)
+            yield from _iter_text_leaves(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _iter_text_leaves(item)
+    elif value is not None:
+        yield str(value)
 
 
 def format_section_content(content: Any, indent: int = 0) -> str:
     """
     Рекурсивно форматирует содержимое раздела в читаемый текст.
     """
+    lines: List[str] = []
+    _format_section_lines(content, indent, lines)
+    return "\n".join(lines)
+
+
+def _format_section_lines(content: Any, indent: int, lines: List[str]) -> None:
+    """Добавляет строки содержимого в общий список lines (одна склейка на весь раздел)."""
     if content is None:
-        return ""
+        return
 
     indent_str = "  " * indent
-    lines = []
 
     if isinstance(content, dict):
         for key, value in content.items():
@@ -58,9 +164,7 @@ def format_section_content(content: Any, indent: int = 0) -> str:
             lines.append(f"{indent_str}**{header}:**")
 
             # Рекурсивно форматируем содержимое
-            formatted_value = format_section_content(value, indent + 1)
-            if formatted_value:
-                lines.append(formatted_value)
+            _format_section_lines(value, indent + 1, lines)
             lines.append("")
 
     elif isinstance(content, list):
@@ -85,7 +189,112 @@ def format_section_content(content: Any, indent: int = 0) -> str:
         # Другие типы (число, bool и т.д.)
         lines.append(f"{indent_str}{content}")
 
-    return "\n".join(lines)
+
+def build_kb_index(sections: Dict[str, dict]) -> KBIndex:
+    """Build BM25 index and section metadata for KB sections."""
+    section_keys = list(sections.keys())
+
+    # Взвешенные частоты терминов по разделам (неизмененные поля берутся из кеша токенов)
+    corpus_term_freqs = [section_term_frequencies(sections[section_key]) for section_key in section_keys]
+
+    section_records = []
+    for section_key in section_keys:
+        section_data = sections[section_key]
+        section_records.append({
+            "section_key": section_key,
+            "title": section_data.get("title", section_key),
+            "content": section_data.get("content"),
+            "source_url": section_data.get("source_url"),
+            "keywords": section_data.get("keywords", []),
+        })
+
+    term_ids, indptr, doc_ids, contributions = _build_postings(corpus_term_freqs)
+    return KBIndex(
+        section_keys=section_keys,
+        sections=section_records,
+        term_ids=term_ids,
+        indptr=indptr,
+        doc_ids=doc_ids,
+        contributions=contributions,
+    )
+
+
+def _build_postings(
+    corpus_term_freqs: List[Counter],
+) -> Tuple[Dict[str, int], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Инвертированный индекс (CSR) с готовыми BM25-вкладами (формула BM25Okapi).
+
+    Все, что не зависит от запроса (idf, tf, нормировка по длине), считается
+    здесь один раз на версию KB; поиск только складывает вклады терминов запроса.
+    """
+    n_docs = len(corpus_term_freqs)
+    raw_postings: Dict[str, Tuple[List[int], List[int]]] = {}
+    for doc_id, term_freqs in enumerate(corpus_term_freqs):
+        for token, count in term_freqs.items():
+            doc_ids, tfs = raw_postings.setdefault(token, ([], []))
+            doc_ids.append(doc_id)
+            tfs.append(count)
+
+    doc_len = np.array([sum(term_freqs.values()) for term_freqs in corpus_term_freqs], dtype=float)
+    avgdl = doc_len.sum() / n_docs if n_docs else 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avgdl)
+
+    # Длина postings термина - его document frequency
+    df = np.array([len(doc_ids) for doc_ids, _ in raw_postings.values()], dtype=np.intp)
+
+    # idf как в rank_bm25: отрицательные значения заменяются на epsilon * средний idf
+    idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+    if len(idf):
+        idf[idf < 0] = BM25_EPSILON * idf.mean()
+
+    # Postings всех терминов подряд, indptr - границы термина (как в scipy CSR)
+    indptr = np.zeros(len(df) + 1, dtype=np.intp)
+    np.cumsum(df, out=indptr[1:])
+    doc_ids = np.fromiter(
+        (doc_id for ids, _ in raw_postings.values() for doc_id in ids), dtype=np.intp, count=indptr[-1]
+    )
+    tf = np.fromiter(
+        (count for _, tfs in raw_postings.values() for count in tfs), dtype=float, count=indptr[-1]
+    )
+    contributions = np.repeat(idf, df) * (tf * (BM25_K1 + 1) / (tf + length_norm[doc_ids]))
+
+    term_ids = {token: term_id for term_id, token in enumerate(raw_postings)}
+    return term_ids, indptr, doc_ids, contributions
+
+
+def _get_kb_index(sections: Dict[str, dict], version: Optional[str]) -> KBIndex:
+    """KB index from cache for the given KB version, or build a new one."""
+    global _KB_INDEX_CACHE
+
+    cached = _KB_INDEX_CACHE
+    if version and cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _KB_INDEX_LOCK:
+        cached = _KB_INDEX_CACHE
+        if version and cached is not None and cached[0] == version:
+            return cached[1]
+
+        kb_index = build_kb_index(sections)
+        if version:
+            _KB_INDEX_CACHE = (version, kb_index)
+        return kb_index
+
+
+def warm_kb_index(kb_content: Optional[dict], version: Optional[str]) -> None:
+    """Построить индекс KB при загрузке базы знаний, а не на первом поисковом запросе."""
+    sections = (kb_content or {}).get("sections")
+    if sections and version:
+        _get_kb_index(sections, version)
+
+
+def invalidate_kb_cache() -> None:
+    """Сбросить кеш BM25 индекса (следующий поиск построит его заново)."""
+    global _KB_INDEX_CACHE
+    with _KB_INDEX_LOCK:
+        _KB_INDEX_CACHE = None
 
 
 def search_knowledge_base_bm25(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
@@ -105,43 +314,27 @@ def search_knowledge_base_bm25(query: str, top_k: int = 3) -> List[Dict[str, Any
     if not sections:
         return []
 
-    # Build corpus for BM25
-    section_keys = list(sections.keys())
-    corpus = []
-
-    for section_key in section_keys:
-        section_data = sections[section_key]
-        searchable_text = build_searchable_text(section_data)
-        corpus.append(searchable_text)
-
-    # Tokenize corpus
-    tokenized_corpus = [tokenize(doc) for doc in corpus]
-
-    # Build BM25 index
-    bm25 = BM25Okapi(tokenized_corpus)
+    kb_index = _get_kb_index(sections, params_manager.get_knowledge_base_version())
 
     # Get scores
     tokenized_query = tokenize(query)
-    scores = bm25.get_scores(tokenized_query)
+    scores = kb_index.get_scores(tokenized_query)
 
-    # Create results with scores
-    results = []
-    for i, section_key in enumerate(section_keys):
-        section_data = sections[section_key]
-        results.append({
-            "section_key": section_key,
-            "title": section_data.get("title", section_key),
-            "content": section_data.get("content"),
-            "source_url": section_data.get("source_url"),
-            "keywords": section_data.get("keywords", []),
-            "score": scores[i]
-        })
-
-    # Sort by score descending
-    results.sort(key=lambda x: x["score"], reverse=True)
-
-    # Return top-K
-    return results[:top_k]
+    # Top-K без полной сортировки: argpartition находит порог k-го результата,
+    # затем стабильно сортируем только кандидатов не ниже порога (при равных
+    # score порядок разделов тот же, что давала полная стабильная сортировка)
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return []
+    threshold = scores[np.argpartition(scores, -k)[-k]]
+    candidates = np.flatnonzero(scores >= threshold)
+    top_indices = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+
+    # Результаты собираем только для вошедших в top-K разделов
+    return [
+        {**kb_index.sections[i], "score": scores[i]}
+        for i in top_indices
+    ]
 
 
 @tool
@@ -28,11 +28,10 @@ async def test_search_company_info():
     except Exception as e:
         print(f"БД недоступна, используем fallback из файла: {e}")
         # Загружаем напрямую из файла для теста
-        import json
+        import orjson
         kb_path = Path(__file__).parent.parent / "data" / "kb.json"
         if kb_path.exists():
-            with open(kb_path, "r", encoding="utf-8") as f:
-                kb_content = json.load(f)
+            kb_content = orjson.loads(kb_path.read_bytes())
             params_manager._kb_content = kb_content
             params_manager._kb_text = params_manager._format_kb_text(kb_content)
     
@@ -0,0 +1,75 @@
+"""
+Сжатие истории диалога перед вызовом агента (включается CONTEXT_TRIM_ENABLED=true).
+
+История режется по репликам (turn = сообщение пользователя + все ответы и вызовы
+инструментов после него):
+- последние CONTEXT_KEEP_TURNS реплик передаются как есть;
+- в более старых репликах весь текст пользователя и ответов сохраняется,
+  убираются только вызовы инструментов и их результаты (объемные результаты поиска).
+
+Пары "AIMessage с tool_calls -> ToolMessage" никогда не разрываются: недавние
+реплики остаются целиком, из старых вызовы инструментов уходят вместе с результатами.
+"""
+import os
+from typing import List
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+# По умолчанию история не сжимается - агент видит ее целиком
+CONTEXT_TRIM_ENABLED = os.getenv("CONTEXT_TRIM_ENABLED", "false").lower() == "true"
+# Сколько последних реплик передавать агенту без изменений
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "30"))
+
+
+def _split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Делит историю на реплики: каждая начинается с HumanMessage."""
+    turns: List[List[BaseMessage]] = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage) or not turns:
+            turns.append([msg])
+        else:
+            turns[-1].append(msg)
+    return turns
+
+
+def _has_text(msg: BaseMessage) -> bool:
+    content = msg.content
+    return bool(content.strip()) if isinstance(content, str) else bool(content)
+
+
+def _drop_tool_payloads(turn: List[BaseMessage]) -> List[BaseMessage]:
+    """Реплика без вызовов инструментов и их результатов; текст сообщений сохраняется."""
+    compacted: List[BaseMessage] = []
+    for msg in turn:
+        if isinstance(msg, ToolMessage):
+            continue
+        if isinstance(msg, AIMessage) and msg.tool_calls:
+            # Текст, сказанный вместе с вызовом инструмента, остается в истории
+            if _has_text(msg):
+                compacted.append(AIMessage(content=msg.content))
+            continue
+        compacted.append(msg)
+    return compacted
+
+
+def trim_context(messages: List[BaseMessage], keep_turns: int = CONTEXT_KEEP_TURNS) -> List[BaseMessage]:
+    """
+    Убирает вызовы инструментов из реплик старше последних keep_turns.
+
+    Args:
+        messages: История диалога (без системных сообщений)
+        keep_turns: Сколько последних реплик оставить без изменений
+
+    Returns:
+        Новый список сообщений; исходный не изменяется
+    """
+    turns = _split_turns(messages)
+    if len(turns) <= keep_turns:
+        return list(messages)
+
+    trimmed: List[BaseMessage] = []
+    for turn in turns[:-keep_turns]:
+        trimmed.extend(_drop_tool_payloads(turn))
+    for turn in turns[-keep_turns:]:
+        trimmed.extend(turn)
+    return trimmed
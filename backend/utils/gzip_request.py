@@ -0,0 +1,85 @@
+"""
+Прием сжатых тел запросов (Content-Encoding: gzip) в FastAPI.
+
+Бот сжимает POST /chat с историей диалога: русский текст в UTF-8 занимает
+2 байта на букву и хорошо сжимается. Стандартный GZipMiddleware сжимает только
+ответы, поэтому тело запроса распаковывается здесь, до роутеров - обработчики
+получают обычный JSON.
+"""
+import zlib
+from typing import List
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Защита от "zip-бомб": распакованное тело больше этого размера отклоняется
+MAX_DECOMPRESSED_BODY_BYTES = 10 * 1024 * 1024
+
+
+class GzipRequestMiddleware:
+    """ASGI middleware: распаковывает тело запроса с Content-Encoding: gzip."""
+
+    def __init__(self, app: ASGIApp, max_body_bytes: int = MAX_DECOMPRESSED_BODY_BYTES) -> None:
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = scope["headers"]
+        encoding = next((value for name, value in headers if name == b"content-encoding"), None)
+        if encoding is None or encoding.strip().lower() != b"gzip":
+            await self.app(scope, receive, send)
+            return
+
+        chunks: List[bytes] = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        # wbits=16+MAX_WBITS - формат gzip (заголовок и CRC), max_length ограничивает распаковку
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(b"".join(chunks), self.max_body_bytes + 1)
+        except zlib.error:
+            await self._reject(send, 400, b"Invalid gzip request body")
+            return
+        if len(body) > self.max_body_bytes:
+            await self._reject(send, 413, b"Request body too large")
+            return
+        if not decompressor.eof:
+            # Поток оборван - JSON внутри был бы неполным
+            await self._reject(send, 400, b"Invalid gzip request body")
+            return
+
+        # Дальше запрос выглядит как обычный несжатый
+        scope = dict(scope)
+        scope["headers"] = [
+            (name, value) for name, value in headers
+            if name not in (b"content-encoding", b"content-length")
+        ] + [(b"content-length", str(len(body)).encode())]
+
+        body_sent = False
+
+        async def receive_decompressed() -> Message:
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.app(scope, receive_decompressed, send)
+
+    @staticmethod
+    async def _reject(send: Send, status: int, detail: bytes) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8")],
+        })
+        await send({"type": "http.response.body", "body": detail})
@@ -26,6 +26,32 @@ import re
 from typing import Dict, Any, List
 
 
+# Стоп-слова на русском (общие для ключевых слов разделов и BM25 поиска по KB)
+STOP_WORDS = frozenset({
+    'и', 'в', 'на', 'для', 'с', 'по', 'о', 'об', 'из', 'к', 'от', 'до',
+    'при', 'про', 'под', 'над', 'между', 'через', 'за', 'без', 'у', 'а',
+    'но', 'или', 'же', 'ли', 'бы', 'не', 'то', 'это', 'весь', 'всё',
+    'как', 'так', 'где', 'что', 'кто', 'чем', 'тем', 'этот', 'эта', 'это',
+    'тот', 'та', 'те', 'наш', 'ваш', 'их', 'его', 'её', 'свой'
+})
+
+# Регулярки компилируются один раз при импорте модуля
+_SECTION_SPLIT_RE = re.compile(r'\n---+\n')  # разделитель разделов "---"
+_WORD_RE = re.compile(r'\w+')
+_NON_WORD_RE = re.compile(r'\W+')
+_UNDERSCORES_RE = re.compile(r'_+')
+
+# Транслитерация русских букв
+TRANSLIT_MAP = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
+    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
+}
+# Таблица для str.translate: буквы по TRANSLIT_MAP, пробел и дефис -> "_"
+_TRANSLIT_TABLE = str.maketrans({**TRANSLIT_MAP, ' ': '_', '-': '_'})
+
 def parse_text_kb(text: str) -> Dict[str, Any]:
     """
     Парсит текстовую базу знаний в структурированный формат для BM25.
@@ -58,7 +84,7 @@ def parse_text_kb(text: str) -> Dict[str, Any]:
         }
 
     # Разбиваем на разделы по разделителю ---
-    raw_sections = re.split(r'\n---+\n', text.strip())
+    raw_sections = _SECTION_SPLIT_RE.split(text.strip())
 
     sections = {}
 
@@ -89,31 +115,20 @@ def parse_section(text: str, index: int = 0) -> Dict[str, Any]:
     - Остальное = содержимое
     - Keywords извлекаются автоматически из заголовка
     """
-    lines = [line for line in text.strip().split('\n')]
-    if not lines:
-        return None
-
-    # Находим первую непустую строку - это заголовок
-    title = None
-    content_start_idx = 0
-
-    for i, line in enumerate(lines):
-        if line.strip():
-            title = line.strip()
-            content_start_idx = i + 1
-            break
+    # После strip первая строка непустая - это заголовок, остальное - содержимое.
+    # partition отделяет заголовок без разбиения всего раздела на строки и обратной склейки
+    title, _, content = text.strip().partition('\n')
+    title = title.strip()
 
     if not title:
-        # Если нет заголовка, используем первые слова содержимого
+        # Пустой раздел - заголовок по номеру
         title = f"Раздел {index + 1}"
-        content_start_idx = 0
 
     # Генерируем ключ раздела из заголовка
     section_key = generate_section_key(title)
 
     # Извлекаем содержимое (все строки после заголовка)
-    content_lines = lines[content_start_idx:]
-    content = '\n'.join(content_lines).strip()
+    content = content.strip()
 
     # Автоматически извлекаем keywords из заголовка
     keywords = extract_keywords(title)
@@ -135,33 +150,20 @@ def extract_keywords(text: str) -> List[str]:
     - Берем слова длиной >= 3 символа
     - Приводим к нижнему регистру
     """
-    # Стоп-слова на русском
-    stop_words = {
-        'и', 'в', 'на', 'для', 'с', 'по', 'о', 'об', 'из', 'к', 'от', 'до',
-        'при', 'про', 'под', 'над', 'между', 'через', 'за', 'без', 'у', 'а',
-        'но', 'или', 'же', 'ли', 'бы', 'не', 'то', 'это', 'весь', 'всё',
-        'как', 'так', 'где', 'что', 'кто', 'чем', 'тем', 'этот', 'эта', 'это',
-        'тот', 'та', 'те', 'наш', 'ваш', 'их', 'его', 'её', 'свой'
-    }
-
-    # Разбиваем на слова и очищаем
-    words = re.findall(r'\w+', text.lower())
-
-    # Фильтруем: длина >= 3, не стоп-слово
-    keywords = [
-        word for word in words
-        if len(word) >= 3 and word not in stop_words
-    ]
-
-    # Убираем дубликаты, сохраняя порядок
+    # Один проход по совпадениям: фильтруем, убираем дубликаты (сохраняя порядок)
+    # и останавливаемся, как только набрали 10 ключевых слов
     seen = set()
     unique_keywords = []
-    for word in keywords:
-        if word not in seen:
-            seen.add(word)
-            unique_keywords.append(word)
+    for match in _WORD_RE.finditer(text):
+        word = match.group().lower()
+        if len(word) < 3 or word in STOP_WORDS or word in seen:
+            continue
+        seen.add(word)
+        unique_keywords.append(word)
+        if len(unique_keywords) == 10:  # Максимум 10 ключевых слов
+            break
 
-    return unique_keywords[:10]  # Максимум 10 ключевых слов
+    return unique_keywords
 
 
 def generate_section_key(title: str) -> str:
@@ -172,30 +174,12 @@ def generate_section_key(title: str) -> str:
         "Контакты и адрес" -> "contacts_and_address"
         "Доставка" -> "delivery"
     """
-    # Транслитерация русских букв
-    translit_map = {
-        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
-        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-        'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
-        'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
-    }
-
-    # Приводим к нижнему регистру
-    key = title.lower()
+    # Транслитерация и пробел/дефис -> "_" за один проход str.translate (в C)
+    key = title.lower().translate(_TRANSLIT_TABLE)
 
-    # Транслитерируем
-    result = []
-    for char in key:
-        if char in translit_map:
-            result.append(translit_map[char])
-        elif char.isalnum():
-            result.append(char)
-        elif char in ' -_':
-            result.append('_')
-
-    # Убираем повторяющиеся подчеркивания и очищаем края
-    key = '_'.join(filter(None, ''.join(result).split('_')))
+    # Прочие не буквенно-цифровые символы убираем, повторяющиеся подчеркивания схлопываем
+    key = _NON_WORD_RE.sub('', key)
+    key = _UNDERSCORES_RE.sub('_', key).strip('_')
 
     return key or 'section'
 
@@ -253,7 +237,13 @@ def format_dict_content(content: Dict[str, Any], indent: int = 0) -> str:
     """
     Форматирует словарь в читаемый текст (для конвертации из JSON).
     """
-    lines = []
+    lines: List[str] = []
+    _format_dict_lines(content, indent, lines)
+    return "\n".join(lines)
+
+
+def _format_dict_lines(content: Dict[str, Any], indent: int, lines: List[str]) -> None:
+    """Обходит словарь и дописывает строки в общий список lines (одна склейка на весь словарь)."""
     indent_str = "  " * indent
 
     for key, value in content.items():
@@ -264,20 +254,19 @@ def format_dict_content(content: Dict[str, Any], indent: int = 0) -> str:
 
         if isinstance(value, dict):
             lines.append(f"{indent_str}{header}:")
-            lines.append(format_dict_content(value, indent + 1))
+            start = len(lines)
+            _format_dict_lines(value, indent + 1, lines)
+            if len(lines) == start:
+                # Пустой вложенный словарь давал пустую строку - сохраняем формат
+                lines.append("")
         elif isinstance(value, list):
             lines.append(f"{indent_str}{header}:")
             for item in value:
                 if isinstance(item, dict):
-                    item_lines = []
-                    for k, v in item.items():
-                        if v:
-                            item_lines.append(f"{k}: {v}")
+                    item_lines = [f"{k}: {v}" for k, v in item.items() if v]
                     if item_lines:
                         lines.append(f"{indent_str}  - {', '.join(item_lines)}")
                 else:
                     lines.append(f"{indent_str}  - {item}")
         else:
             lines.append(f"{indent_str}{header}: {value}")
-
-    return "\n".join(lines)
@@ -3,37 +3,48 @@ from pathlib import Path
 from logging.handlers import RotatingFileHandler
 
 def setup_logging(service_name: str, log_dir: Path = Path("logs")):
-    """Настройка логирования в файл для сервиса."""
+    """
+    Настройка логирования в файл для сервиса.
+
+    Идемпотентна: модули одного процесса (api, роутеры) вызывают ее повторно,
+    handlers на root logger добавляются только один раз - иначе каждая запись
+    писалась бы в файл и консоль столько раз, сколько было вызовов.
+    """
     log_dir.mkdir(exist_ok=True)
     log_file = log_dir / f"{service_name}.log"
-    
-    # Создаем handler с ротацией (макс 10MB, 5 файлов)
-    file_handler = RotatingFileHandler(
-        log_file, 
-        maxBytes=10*1024*1024, 
-        backupCount=5,
-        encoding='utf-8'
-    )
-    file_handler.setLevel(logging.INFO)
-    
+
+    # Настраиваем root logger
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+
     # Формат логов
     formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
-    file_handler.setFormatter(formatter)
-    
-    # Настраиваем root logger
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    logger.addHandler(file_handler)
-    
-    # Также выводим в консоль
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    return logging.getLogger(service_name)
 
+    log_path = str(log_file.resolve())
+    has_file_handler = any(
+        isinstance(h, RotatingFileHandler) and h.baseFilename == log_path
+        for h in logger.handlers
+    )
+    if not has_file_handler:
+        # Создаем handler с ротацией (макс 10MB, 5 файлов)
+        file_handler = RotatingFileHandler(
+            log_file,
+            maxBytes=10*1024*1024,
+            backupCount=5,
+            encoding='utf-8'
+        )
+        file_handler.setLevel(logging.INFO)
+        file_handler.setFormatter(formatter)
+        logger.addHandler(file_handler)
 
+    # Также выводим в консоль (один handler на процесс)
+    if not any(getattr(h, "_setup_logging_console", False) for h in logger.handlers):
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(formatter)
+        console_handler._setup_logging_console = True
+        logger.addHandler(console_handler)
 
+    return logging.getLogger(service_name)
@@ -0,0 +1,58 @@
+"""
+Ограниченное in-memory хранилище FSM для aiogram (fallback, когда Redis не настроен).
+
+Стандартный MemoryStorage хранит состояние каждого пользователя до перезапуска бота.
+Здесь записи вытесняются по LRU (не больше maxsize пользователей) и по TTL
+с момента последнего обращения - брошенные диалоги не копятся в памяти.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+
+class BoundedMemoryStorage(BaseStorage):
+    """FSM storage в памяти процесса с LRU + TTL вытеснением. Все операции O(1)."""
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 3600.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (истекает_в, state, data); порядок - от давно использованных к недавним
+        self._records: "OrderedDict[StorageKey, Tuple[float, Optional[str], Dict[str, Any]]]" = OrderedDict()
+
+    def _get_record(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        record = self._records.get(key)
+        if record is None:
+            return None, {}
+        if record[0] <= time.monotonic():
+            del self._records[key]
+            return None, {}
+        self._records.move_to_end(key)
+        return record[1], record[2]
+
+    def _put_record(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> None:
+        self._records[key] = (time.monotonic() + self.ttl, state, data)
+        self._records.move_to_end(key)
+        while len(self._records) > self.maxsize:
+            self._records.popitem(last=False)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = self._get_record(key)
+        self._put_record(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = self._get_record(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        state, _ = self._get_record(key)
+        self._put_record(key, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = self._get_record(key)
+        return data.copy()
+
+    async def close(self) -> None:
+        self._records.clear()
@@ -14,10 +14,15 @@
 
 import logging
 from typing import Optional, Tuple, Dict
-import re
 
 logger = logging.getLogger(__name__)
 
+# Разделитель тысяч: "1,234" -> "1 234" (str.translate, без второго прохода replace)
+_COMMA_TO_SPACE = str.maketrans(",", " ")
+
+# Допустимые символы количества штук в "м3 (33.33 шт)"
+_QTY_CHARS = '0123456789.'
+
 
 def parse_unit(unit_str: str) -> Tuple[str, Optional[float]]:
     """
@@ -35,15 +40,30 @@ def parse_unit(unit_str: str) -> Tuple[str, Optional[float]]:
     if not unit_str:
         return ("шт", None)
 
-    # Парсим формат "м3 (33.33 шт)"
-    match = re.match(r'(\S+)\s*\(([0-9.]+)\s*шт\)', unit_str.strip())
-    if match:
-        base_unit = match.group(1)
-        qty_per_unit = float(match.group(2))
-        return (base_unit, qty_per_unit)
+    s = unit_str.strip()
+
+    # Парсим формат "м3 (33.33 шт)" ручным сканом по скобкам (без regex)
+    lp = s.find('(')
+    if lp > 0:
+        base_unit = s[:lp].rstrip()
+        rp = s.find(')', lp)
+        if rp != -1 and base_unit and len(base_unit.split()) == 1:
+            inner = s[lp + 1:rp]
+            if inner.endswith('шт'):
+                qty = inner[:-2].rstrip()
+                if qty and not qty.strip(_QTY_CHARS):
+                    try:
+                        return (base_unit, float(qty))
+                    except ValueError:
+                        pass
 
     # Просто единица без скобок
-    return (unit_str.strip(), None)
+    return (s, None)
+
+
+def format_rub(value: float) -> str:
+    """Целые рубли с пробелом-разделителем тысяч: 12345.6 -> "12 346"."""
+    return f"{value:,.0f}".translate(_COMMA_TO_SPACE)
 
 
 def calculate_price_per_piece(
@@ -155,12 +175,12 @@ def format_product_info(product_data: Dict) -> str:
 
     # Цена
     if price:
-        info_parts.append(f"Цена: {price:,.0f} ₽/{base_unit}".replace(",", " "))
+        info_parts.append(f"Цена: {format_rub(price)} ₽/{base_unit}")
 
         # Если есть цена за штуку - добавим её
         if pieces_per_unit and pieces_per_unit > 0:
             price_per_piece = price / pieces_per_unit
-            info_parts.append(f"({price_per_piece:,.0f} ₽/шт)".replace(",", " "))
+            info_parts.append(f"({format_rub(price_per_piece)} ₽/шт)")
 
     # Остаток
     info_parts.append(f"Остаток: {stock}")
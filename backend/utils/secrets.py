@@ -1,6 +1,7 @@
 import base64
 import hashlib
 import os
+from functools import lru_cache
 from typing import Optional
 import importlib
 
@@ -18,6 +19,15 @@ def get_fernet(master_key: Optional[str] = None):
     mk = master_key or os.getenv("SECRETS_MASTER_KEY", "")
     if not mk:
         raise RuntimeError("SECRETS_MASTER_KEY is not set")
+    return _fernet_for_key(mk)
+
+
+@lru_cache(maxsize=4)
+def _fernet_for_key(mk: str):
+    """
+    Fernet instance per master key: SHA256 derivation and the import
+    run once per key instead of on every encrypt/decrypt call.
+    """
     # Lazy import to avoid tooling issues in environments without cryptography installed
     mod = importlib.import_module("cryptography.fernet")
     FernetCls = getattr(mod, "Fernet")
@@ -0,0 +1,91 @@
+"""
+Ограничение частоты исходящих запросов бота к Telegram Bot API.
+
+Telegram допускает ~30 сообщений в секунду на бота и ~20 сообщений в минуту
+в один чат; при превышении отвечает ошибкой retry_after и ответ теряется.
+Middleware сессии бота ставит запросы в очередь через token bucket,
+а не отправляет их пачкой.
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import SendChatAction, TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+
+class AsyncTokenBucket:
+    """Token bucket: не больше rate запросов за period секунд, ожидающие идут по очереди."""
+
+    def __init__(self, rate: float, period: float = 1.0) -> None:
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.period)
+        self._updated = now
+
+    def is_idle(self) -> bool:
+        """Bucket полон и никто не ждет - его можно удалить без потери ограничения."""
+        self._refill()
+        return self._tokens >= self.rate and not self._lock.locked()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) * self.period / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class TelegramRateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Общий лимит на бота + лимит на чат для всех методов Bot API.
+
+    "Печатает..." (SendChatAction) идет только через общий лимит: это не сообщение,
+    и оно не должно съедать поминутную квоту ответов в чат.
+    """
+
+    # При стольких bucket'ах чатов неактивные удаляются
+    MAX_CHAT_BUCKETS = 10_000
+
+    def __init__(
+        self,
+        global_rate: float = 28,
+        global_period: float = 1.0,
+        chat_rate: float = 20,
+        chat_period: float = 60.0,
+    ) -> None:
+        self.global_limit = AsyncTokenBucket(global_rate, global_period)
+        self.chat_rate = chat_rate
+        self.chat_period = chat_period
+        self._chat_limits: Dict[Any, AsyncTokenBucket] = {}
+
+    def _get_chat_limit(self, chat_id: Any) -> AsyncTokenBucket:
+        limit = self._chat_limits.get(chat_id)
+        if limit is None:
+            if len(self._chat_limits) >= self.MAX_CHAT_BUCKETS:
+                self._chat_limits = {
+                    key: bucket for key, bucket in self._chat_limits.items() if not bucket.is_idle()
+                }
+            limit = self._chat_limits[chat_id] = AsyncTokenBucket(self.chat_rate, self.chat_period)
+        return limit
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id: Optional[Any] = getattr(method, "chat_id", None)
+        if chat_id is not None and not isinstance(method, SendChatAction):
+            await self._get_chat_limit(chat_id).acquire()
+        await self.global_limit.acquire()
+        return await make_request(bot, method)
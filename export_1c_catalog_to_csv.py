@@ -6,13 +6,21 @@
 2. Детальную информацию по ВСЕМ товарам из POST /GetDetailedItems
 3. Сохраняет в CSV с полной структурой полей
 """
+import argparse
+import time
+from pathlib import Path
+
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 import csv
+from collections import Counter
 import json
-from typing import List, Dict
+import statistics
+from typing import List, Dict, Iterable, Iterator
 from datetime import datetime
-import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 
 
 # Конфигурация API
@@ -23,25 +31,88 @@ HEADERS = {
     'Accept': 'application/json'
 }
 
+# Сколько батчей GetDetailedItems запрашивать одновременно (чтобы не перегружать 1С)
+DETAILED_CONCURRENCY = 8
+
+# Кеш ответа GetGroups между запусками (структура каталога меняется редко)
+CACHE_DIR = Path(__file__).parent / ".cache"
+GROUPS_CACHE_FILE = CACHE_DIR / "1c_groups.json"
+GROUPS_ETAG_FILE = CACHE_DIR / "1c_groups.etag"
+GROUPS_CACHE_TTL = 3600  # секунд
+
+
+def create_session() -> requests.Session:
+    """
+    Общая HTTP сессия к 1С: keep-alive соединения переиспользуются всеми запросами
+    вместо нового TCP-подключения на каждый батч. Пул рассчитан на параллельные батчи.
+    """
+    session = requests.Session()
+    session.auth = AUTH
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=DETAILED_CONCURRENCY)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 
-def get_all_groups() -> Dict:
+SESSION = create_session()
+
+
+def _fetch_groups_json(cache_ttl: int) -> bytes:
+    """
+    Сырой JSON GetGroups: из файлового кеша, если он моложе cache_ttl секунд,
+    иначе с сервера. Если сервер отдает ETag, повторный запрос идет с If-None-Match
+    и при 304 используется сохраненный ответ.
+    """
+    if cache_ttl > 0 and GROUPS_CACHE_FILE.exists():
+        age = time.time() - GROUPS_CACHE_FILE.stat().st_mtime
+        if age < cache_ttl:
+            print(f"   💾 Из кеша {GROUPS_CACHE_FILE.name} (возраст {age:.0f} сек)")
+            return GROUPS_CACHE_FILE.read_bytes()
+
+    headers = dict(HEADERS)
+    if cache_ttl > 0 and GROUPS_CACHE_FILE.exists() and GROUPS_ETAG_FILE.exists():
+        headers['If-None-Match'] = GROUPS_ETAG_FILE.read_text(encoding='utf-8')
+
+    response = SESSION.get(
+        f"{BASE_URL}/GetGroups",
+        headers=headers,
+        timeout=30
+    )
+
+    if response.status_code == 304:
+        print("   💾 Каталог не изменился (304), используем кеш")
+        GROUPS_CACHE_FILE.touch()
+        return GROUPS_CACHE_FILE.read_bytes()
+
+    response.raise_for_status()
+    content = response.content
+
+    if cache_ttl > 0:
+        CACHE_DIR.mkdir(exist_ok=True)
+        GROUPS_CACHE_FILE.write_bytes(content)
+        etag = response.headers.get('ETag')
+        if etag:
+            GROUPS_ETAG_FILE.write_text(etag, encoding='utf-8')
+        else:
+            GROUPS_ETAG_FILE.unlink(missing_ok=True)
+
+    return content
+
+
+def get_all_groups(cache_ttl: int = GROUPS_CACHE_TTL) -> Dict:
     """
     Получить все группы и товары из GetGroups.
 
+    Args:
+        cache_ttl: Сколько секунд использовать сохраненный ответ (0 - без кеша)
+
     Returns:
         {"groups": [{"название": "...", "номенклатура": "...", "items": [...]}, ...]}
     """
     print("📦 Получение каталога из GET /GetGroups...")
 
     try:
-        response = requests.get(
-            f"{BASE_URL}/GetGroups",
-            auth=AUTH,
-            headers=HEADERS,
-            timeout=30
-        )
-        response.raise_for_status()
-        data = response.json()
+        data = json.loads(_fetch_groups_json(cache_ttl).decode('utf-8-sig'))
 
         groups_count = len(data.get('groups', []))
         items_count = sum(len(g.get('items', [])) for g in data.get('groups', []))
@@ -73,17 +144,17 @@ def get_detailed_items(item_codes: List[str], batch_num: int = 0, total_batches:
     print(f"   🔍 {batch_info} Получение деталей для {len(item_codes)} товаров...")
 
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{BASE_URL}/GetDetailedItems",
             json={"items": item_codes},
-            auth=AUTH,
             headers={'Content-Type': 'application/json; charset=utf-8'},
             timeout=60
         )
-        response.encoding = response.apparent_encoding or 'utf-8'
         response.raise_for_status()
 
-        data = response.json()
+        # 1С отдает UTF-8 (иногда с BOM): декодируем напрямую, без угадывания
+        # кодировки через apparent_encoding (полный проход детектора по телу ответа)
+        data = json.loads(response.content.decode('utf-8-sig'))
         items = data.get('items', [])
 
         print(f"      ✅ Получено {len(items)} деталей")
@@ -94,113 +165,114 @@ def get_detailed_items(item_codes: List[str], batch_num: int = 0, total_batches:
         return []
 
 
-def get_all_detailed_items(item_codes: List[str], batch_size: int = 50) -> List[Dict]:
+def get_all_detailed_items(
+    item_codes: List[str],
+    batch_size: int = 50,
+    concurrency: int = DETAILED_CONCURRENCY
+) -> List[Dict]:
     """
     Получить детальную информацию по всем товарам (батчами).
 
     Args:
         item_codes: Список всех кодов товаров
         batch_size: Размер батча (по умолчанию 50)
+        concurrency: Сколько батчей запрашивать одновременно
 
     Returns:
         Список всех товаров с детальной информацией
     """
     print(f"\n📋 Получение детальной информации по {len(item_codes)} товарам...")
-    print(f"   Размер батча: {batch_size}")
+    print(f"   Размер батча: {batch_size}, параллельно: {concurrency}")
 
     all_items = []
-    total_batches = (len(item_codes) + batch_size - 1) // batch_size
-
-    for i in range(0, len(item_codes), batch_size):
-        batch = item_codes[i:i + batch_size]
-        batch_num = (i // batch_size) + 1
-
-        items = get_detailed_items(batch, batch_num, total_batches)
-        all_items.extend(items)
-
-        # Небольшая задержка между запросами
-        if i + batch_size < len(item_codes):
-            time.sleep(0.5)
+    batches = [item_codes[i:i + batch_size] for i in range(0, len(item_codes), batch_size)]
+    total_batches = len(batches)
+
+    # Батчи запрашиваются параллельно в пуле потоков (не больше concurrency
+    # одновременно) вместо последовательных запросов с паузой между ними;
+    # map отдает результаты в порядке батчей
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = executor.map(
+            get_detailed_items, batches, range(1, total_batches + 1), repeat(total_batches)
+        )
+        for items in results:
+            all_items.extend(items)
 
     print(f"\n   ✅ Всего получено деталей: {len(all_items)}/{len(item_codes)}")
     return all_items
 
 
-def flatten_catalog(catalog: Dict) -> List[Dict]:
+def flatten_catalog(catalog: Dict) -> Iterator[Dict]:
     """
-    Преобразует структуру каталога в flat список товаров.
+    Преобразует структуру каталога в flat поток товаров.
+
+    Генератор: записи не копятся в отдельном списке, каталог можно
+    обойти повторно (он уже целиком в памяти после GetGroups).
 
     Args:
         catalog: {"groups": [...]}
 
-    Returns:
-        [{"group_name": "...", "group_code": "...", "item_code": "...", "item_name": "..."}, ...]
+    Yields:
+        {"group_name": "...", "group_code": "...", "item_code": "...", "item_name": "..."}
     """
-    print("\n🔄 Преобразование в flat структуру...")
-
-    flat_items = []
     for group in catalog.get('groups', []):
         group_name = group.get('название', '')
         group_code = group.get('номенклатура', '')
 
         for item in group.get('items', []):
-            flat_items.append({
+            yield {
                 'group_name': group_name,
                 'group_code': group_code,
                 'item_code': item.get('номенклатура', ''),
                 'item_name': item.get('название', '')
-            })
+            }
 
-    print(f"   ✅ Создано {len(flat_items)} записей")
-    return flat_items
+
+def build_detailed_map(detailed_items: Iterable[Dict]) -> Dict[str, Dict]:
+    """
+    Индекс детальной информации для merge_data (строится один раз).
+
+    Ключ - Код товара, а если код пустой - Наименование.
+    """
+    detailed_map = {}
+    for item in detailed_items:
+        key = item.get('Код', '') or item.get('Наименование', '')
+        if key:
+            detailed_map[key] = item
+    return detailed_map
 
 
-def merge_data(flat_items: List[Dict], detailed_items: List[Dict]) -> List[Dict]:
+def merge_data(flat_items: Iterable[Dict], detailed_map: Dict[str, Dict]) -> Iterator[Dict]:
     """
-    Объединяет flat список с детальной информацией.
+    Объединяет flat поток с детальной информацией.
 
     Args:
         flat_items: Базовая информация (группа, название)
-        detailed_items: Детальная информация (размеры, цены, характеристики)
+        detailed_map: Индекс деталей из build_detailed_map
 
-    Returns:
-        Полный список товаров со всеми полями
+    Yields:
+        Товары со всеми полями (по мере обхода flat_items)
     """
     print("\n🔗 Объединение данных...")
 
-    # Создаем индекс для быстрого поиска
-    detailed_map = {}
-    for item in detailed_items:
-        # Иногда код пустой, используем название как ключ
-        code = item.get('Код', '') or item.get('Наименование', '')
-        if code:
-            detailed_map[code] = item
-
-    # Объединяем
-    merged = []
+    total = 0
     matched = 0
 
     for flat in flat_items:
-        item_code = flat['item_code']
-        item_name = flat['item_name']
+        total += 1
 
         # Ищем детали по коду или по названию
-        detailed = detailed_map.get(item_code) or detailed_map.get(item_name)
+        detailed = detailed_map.get(flat['item_code']) or detailed_map.get(flat['item_name'])
 
         if detailed:
             matched += 1
-            # Объединяем все поля
-            merged_item = {
-                **flat,  # group_name, group_code, item_code, item_name
-                **detailed  # все поля из API
-            }
-            merged.append(merged_item)
+            # Объединяем все поля: group_name, group_code, item_code, item_name + поля из API
+            yield {**flat, **detailed}
         else:
             # Если деталей нет - добавляем базовую информацию
-            merged.append(flat)
+            yield flat
 
-    print(f"   ✅ Сопоставлено: {matched}/{len(flat_items)} товаров")
-    return merged
+    print(f"   ✅ Сопоставлено: {matched}/{total} товаров")
 
 
 def save_to_csv(data: List[Dict], filename: str = "1c_catalog_full.csv"):
@@ -257,9 +329,32 @@ def save_to_csv(data: List[Dict], filename: str = "1c_catalog_full.csv"):
         print(f"   ❌ Ошибка сохранения: {e}")
 
 
-def print_summary(data: List[Dict]):
-    """Выводит статистику по данным."""
-    if not data:
+def print_summary(data: Iterable[Dict]):
+    """Выводит статистику по данным (один проход по потоку товаров)."""
+    total = 0
+    unique_groups = set()
+    # Счетчики по полю - один проход по данным вместо пересчета на каждое значение
+    types = Counter()
+    species = Counter()
+    grades = Counter()
+    lengths = Counter()
+    prices = []
+
+    for item in data:
+        total += 1
+        unique_groups.add(item.get('group_name', ''))
+        if value := item.get('Видпиломатериала'):
+            types[value] += 1
+        if value := item.get('Порода'):
+            species[value] += 1
+        if value := item.get('Сорт'):
+            grades[value] += 1
+        if (price := item.get('Цена')) and price != '0':
+            prices.append(float(price))
+        if (length := item.get('Длина')) and length != '0':
+            lengths[length] += 1
+
+    if not total:
         return
 
     print(f"\n" + "=" * 80)
@@ -268,53 +363,43 @@ def print_summary(data: List[Dict]):
 
     # Общее
     print(f"\n🔢 Общее:")
-    print(f"   Всего товаров: {len(data)}")
+    print(f"   Всего товаров: {total}")
 
     # Группы
-    unique_groups = set(item.get('group_name', '') for item in data)
     print(f"   Уникальных групп: {len(unique_groups)}")
 
     # Виды пиломатериалов
-    types = set(item.get('Видпиломатериала', '') for item in data if item.get('Видпиломатериала'))
     print(f"\n🪵 Виды пиломатериалов ({len(types)}):")
     for t in sorted(types):
-        count = sum(1 for item in data if item.get('Видпиломатериала') == t)
-        print(f"   - {t}: {count} шт")
+        print(f"   - {t}: {types[t]} шт")
 
     # Породы
-    species = set(item.get('Порода', '') for item in data if item.get('Порода'))
     print(f"\n🌲 Породы ({len(species)}):")
     for s in sorted(species):
-        count = sum(1 for item in data if item.get('Порода') == s)
-        print(f"   - {s}: {count} шт")
+        print(f"   - {s}: {species[s]} шт")
 
     # Сорта
-    grades = set(item.get('Сорт', '') for item in data if item.get('Сорт'))
     print(f"\n⭐ Сорта/Классы ({len(grades)}):")
     for g in sorted(grades):
-        count = sum(1 for item in data if item.get('Сорт') == g)
-        print(f"   - {g}: {count} шт")
+        print(f"   - {g}: {grades[g]} шт")
 
     # Цены
-    prices = [float(item.get('Цена', 0)) for item in data if item.get('Цена') and item.get('Цена') != '0']
     if prices:
         print(f"\n💰 Цены:")
         print(f"   Мин: {min(prices):,.0f} ₽")
         print(f"   Макс: {max(prices):,.0f} ₽")
-        print(f"   Средняя: {sum(prices)/len(prices):,.0f} ₽")
-        print(f"   Товаров с ценами: {len(prices)}/{len(data)}")
+        print(f"   Средняя: {statistics.fmean(prices):,.0f} ₽")
+        print(f"   Товаров с ценами: {len(prices)}/{total}")
 
     # Размеры
-    lengths = set(item.get('Длина', '') for item in data if item.get('Длина') and item.get('Длина') != '0')
     print(f"\n📏 Длины ({len(lengths)}):")
     for l in sorted(lengths):
-        count = sum(1 for item in data if item.get('Длина') == l)
-        print(f"   - {l}мм: {count} шт")
+        print(f"   - {l}мм: {lengths[l]} шт")
 
     print("\n" + "=" * 80)
 
 
-def main():
+def main(cache_ttl: int = GROUPS_CACHE_TTL):
     """Основная функция."""
     print("\n" + "=" * 80)
     print("🚀 ЭКСПОРТ КАТАЛОГА 1С В CSV")
@@ -323,24 +408,23 @@ def main():
     print()
 
     # 1. Получаем каталог
-    catalog = get_all_groups()
+    catalog = get_all_groups(cache_ttl)
 
     if not catalog.get('groups'):
         print("\n❌ Не удалось получить каталог. Завершение.")
         return
 
-    # 2. Преобразуем в flat список
-    flat_items = flatten_catalog(catalog)
-
-    # 3. Получаем все коды товаров
-    all_codes = list(set(item['item_code'] for item in flat_items if item['item_code']))
+    # 2-3. Получаем все коды товаров (dict.fromkeys: без дубликатов, в порядке каталога)
+    all_codes = list(dict.fromkeys(
+        item['item_code'] for item in flatten_catalog(catalog) if item['item_code']
+    ))
     print(f"\n   Уникальных кодов товаров: {len(all_codes)}")
 
-    # 4. Получаем детали (батчами)
-    detailed_items = get_all_detailed_items(all_codes, batch_size=50)
+    # 4. Получаем детали (батчами) и сразу индексируем - список деталей не держим
+    detailed_map = build_detailed_map(get_all_detailed_items(all_codes, batch_size=50))
 
-    # 5. Объединяем данные
-    merged_data = merge_data(flat_items, detailed_items)
+    # 5. Объединяем данные (один раз - результат нужен и для CSV, и для статистики)
+    merged_data = list(merge_data(flatten_catalog(catalog), detailed_map))
 
     # 6. Сохраняем в CSV
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -355,6 +439,16 @@ def main():
     print(f"   Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 80 + "\n")
 
+    SESSION.close()
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Экспорт полного каталога 1С в CSV")
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=GROUPS_CACHE_TTL,
+        help="Сколько секунд использовать сохраненный ответ GetGroups (0 - всегда запрашивать)",
+    )
+    args = parser.parse_args()
+    main(cache_ttl=args.cache_ttl)
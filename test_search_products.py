@@ -1,58 +1,93 @@
 """
-Тестовый скрипт для проверки нового search_products tool.
+Тестовый скрипт для проверки поиска товаров (tools/product_search_bm25.py).
 
 Проверяет:
-1. Кэширование flat-каталога из GetGroups
-2. Keyword search с нормализацией
-3. Scoring по релевантности
-4. Обогащение ценами из GetItems
+1. Нормализацию запросов (метры -> мм, размеры 150x150)
+2. Токенизацию запросов
+3. Scoring BM25 по релевантности
+4. Загрузку снимка каталога из Redis
+5. Поиск в каталоге
+6. Полный search_products_tool
 """
 import asyncio
+import math
+import os
 import sys
+import time
+from collections import Counter
+from itertools import cycle, islice, product
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
 # Добавляем backend в путь
 backend_path = Path(__file__).parent / "backend"
 sys.path.insert(0, str(backend_path))
 
-from tools.search_products import (
-    normalize_query,
-    extract_keywords,
-    score_item,
-    search_in_flat_catalog,
-    get_flat_catalog,
-    SearchProductsRequest,
-    search_products
+from tools.product_search_bm25 import (
+    BM25_B,
+    BM25_EPSILON,
+    BM25_K1,
+    CATALOG_COLUMNS,
+    CatalogSnapshot,
+    ProductSearchParams,
+    _build_snapshot,
+    load_catalog_snapshot,
+    search_products,
+    search_products_tool,
+    tokenize,
+    tokenize_query,
 )
 
+# Тест на синтетическом каталоге (десятки тысяч товаров) - только при PYTEST_PERF=1
+RUN_PERF_TESTS = os.getenv("PYTEST_PERF") == "1"
+
+# Вывод копится построчно и пишется в stdout одним вызовом на секцию
+_buf: list = []
+
+
+def p(*args) -> None:
+    """print в буфер секции."""
+    _buf.append(" ".join(map(str, args)))
+
+
+def flush_output() -> None:
+    """Записать накопленную секцию в stdout одним write."""
+    if _buf:
+        sys.stdout.write("\n".join(_buf) + "\n")
+        sys.stdout.flush()
+        _buf.clear()
+
 
 async def test_normalize_query():
     """Тест нормализации запросов."""
-    print("=" * 80)
-    print("1. ТЕСТ НОРМАЛИЗАЦИИ ЗАПРОСОВ")
-    print("=" * 80)
+    p("=" * 80)
+    p("1. ТЕСТ НОРМАЛИЗАЦИИ ЗАПРОСОВ")
+    p("=" * 80)
 
     test_cases = [
         ("вагонка 6м", "вагонка 6000"),
         ("брус 150x150", "брус 150 150"),
-        ("евровагонка 3 метра", "вагонка 3000"),
-        ("блокхаус класс АВ", "блок хаус класс ав"),
+        ("евровагонка 3 метра", "евровагонка 3000"),
+        ("блокхаус класс АВ", "блокхаус класс ав"),
     ]
 
     for input_query, expected in test_cases:
-        result = normalize_query(input_query)
+        result = " ".join(tokenize_query(input_query))
         status = "✅" if expected in result else "❌"
-        print(f"{status} '{input_query}' → '{result}'")
+        p(f"{status} '{input_query}' → '{result}'")
         if expected not in result:
-            print(f"   Ожидалось: '{expected}'")
-    print()
+            p(f"   Ожидалось: '{expected}'")
+    p()
+    flush_output()
 
 
 async def test_extract_keywords():
-    """Тест извлечения ключевых слов."""
-    print("=" * 80)
-    print("2. ТЕСТ ИЗВЛЕЧЕНИЯ КЛЮЧЕВЫХ СЛОВ")
-    print("=" * 80)
+    """Тест токенизации запросов."""
+    p("=" * 80)
+    p("2. ТЕСТ ТОКЕНИЗАЦИИ ЗАПРОСОВ")
+    p("=" * 80)
 
     test_cases = [
         "вагонка 6 метров класс АВ",
@@ -61,143 +96,241 @@ async def test_extract_keywords():
     ]
 
     for query in test_cases:
-        keywords = extract_keywords(query)
-        print(f"'{query}'")
-        print(f"  → {keywords}")
-    print()
+        p(f"'{query}'")
+        p(f"  → {tokenize_query(query)}")
+    p()
+    flush_output()
 
 
 async def test_scoring():
     """Тест scoring алгоритма."""
-    print("=" * 80)
-    print("3. ТЕСТ SCORING АЛГОРИТМА")
-    print("=" * 80)
+    p("=" * 80)
+    p("3. ТЕСТ SCORING АЛГОРИТМА")
+    p("=" * 80)
 
-    keywords = ["вагонка", "6000", "ав"]
+    query = "вагонка 6000 ав"
 
     items = [
         "Вагонка штиль стр. сух. хв. 13х115х6000 класс АВ",  # Полное совпадение
         "Вагонка штиль стр. сух. хв. 13х115х6000 класс С",   # Нет "АВ"
         "Вагонка штиль стр. сух. хв. 13х115х3000 класс АВ",  # Нет "6000"
-        "Евровагонка стр. сух. хв. 12,5х90х6000 класс АВ",   # Частичное "вагонка"
+        "Евровагонка стр. сух. хв. 12,5х90х6000 класс АВ",   # Нет "вагонка"
         "Брус клееный стр. сух. хв. 150х150х6000 класс АВ",  # Нет "вагонка"
     ]
 
-    scored = []
-    for item_name in items:
-        score = score_item(item_name, keywords)
-        scored.append((score, item_name))
-
-    scored.sort(reverse=True)
-
-    print(f"Запрос: {keywords}\n")
-    for score, name in scored:
-        print(f"Score {score:5.1f}: {name}")
-    print()
-
-
-async def test_get_flat_catalog():
-    """Тест получения flat-каталога."""
-    print("=" * 80)
-    print("4. ТЕСТ ПОЛУЧЕНИЯ FLAT-КАТАЛОГА")
-    print("=" * 80)
+    snapshot = _build_snapshot(pd.DataFrame({"item_name": items}, columns=CATALOG_COLUMNS))
+    scores = snapshot.term_index.get_scores(np.arange(len(items)), tokenize_query(query))
+
+    p(f"Запрос: {tokenize_query(query)}\n")
+    for position in np.argsort(-scores, kind="stable"):
+        p(f"Score {scores[position]:5.2f}: {items[position]}")
+    p()
+    flush_output()
+
+
+def _gen_synthetic_catalog(n: int = 50000) -> list:
+    """Названия товаров: декартово произведение типов, размеров, длин, пород и классов."""
+    kinds = ["Вагонка штиль", "Евровагонка", "Брус клееный", "Блок-хаус", "Доска обрезная", "Имитация бруса"]
+    sizes = ["13х115", "12,5х90", "20х140", "50х150", "150х150", "28х145"]
+    lengths = ["2000", "3000", "4000", "6000"]
+    species = ["хв.", "лиственница", "осина", "кедр"]
+    grades = ["класс АВ", "класс А", "класс В", "класс С", "Экстра"]
+    names = (
+        f"{kind} стр. сух. {wood} {size}х{length} {grade}"
+        for kind, size, length, wood, grade in product(kinds, sizes, lengths, species, grades)
+    )
+    return list(islice(cycle(names), n))
+
+
+def _reference_bm25_scores(docs: list, query_tokens: list) -> list:
+    """BM25Okapi на чистом Python (как rank_bm25) - эталон для индекса."""
+    doc_freqs = [Counter(doc) for doc in docs]
+    avgdl = sum(len(doc) for doc in docs) / len(docs)
+    df = Counter(term for freqs in doc_freqs for term in freqs)
+    idf = {term: math.log(len(docs) - n + 0.5) - math.log(n + 0.5) for term, n in df.items()}
+    eps = BM25_EPSILON * sum(idf.values()) / len(idf)
+    idf = {term: value if value >= 0 else eps for term, value in idf.items()}
+
+    scores = []
+    for doc, freqs in zip(docs, doc_freqs):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / avgdl)
+        scores.append(sum(
+            idf.get(q, 0.0) * freqs[q] * (BM25_K1 + 1) / (freqs[q] + norm)
+            for q in query_tokens
+        ))
+    return scores
+
+
+async def test_scoring_synthetic(n: int = 50000, top_k: int = 10):
+    """Тест scoring на синтетическом каталоге: индекс против эталона на чистом Python."""
+    p("=" * 80)
+    p(f"3a. ТЕСТ SCORING НА СИНТЕТИЧЕСКОМ КАТАЛОГЕ ({n} товаров)")
+    p("=" * 80)
+
+    items = _gen_synthetic_catalog(n)
+    started = time.perf_counter()
+    snapshot = _build_snapshot(pd.DataFrame({"item_name": items}, columns=CATALOG_COLUMNS))
+    p(f"Сборка снимка: {time.perf_counter() - started:.2f} с")
+    docs = [tokenize(item) for item in items]
+
+    for query in ["вагонка 6 метров класс АВ", "брус клееный 150x150", "блок хаус лиственница"]:
+        query_tokens = tokenize_query(query)
+
+        started = time.perf_counter()
+        expected = np.array(_reference_bm25_scores(docs, query_tokens))
+        reference_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        scores = snapshot.term_index.get_scores(np.arange(n), query_tokens)
+        index_time = time.perf_counter() - started
+
+        top = np.argsort(-scores, kind="stable")[:top_k]
+        expected_top = np.argsort(-expected, kind="stable")[:top_k]
+        ok = np.allclose(scores, expected) and np.allclose(scores[top], expected[expected_top])
+        status = "✅" if ok and scores.argmax() == expected.argmax() else "❌"
+        p(
+            f"{status} '{query}': Python {reference_time * 1000:.0f} мс, "
+            f"индекс {index_time * 1000:.1f} мс, топ-1: {items[scores.argmax()]}"
+        )
+    p()
+    flush_output()
+
+
+async def test_get_flat_catalog(catalog_task: "asyncio.Task[CatalogSnapshot]"):
+    """Тест загрузки снимка каталога (загрузка запущена заранее в main)."""
+    p("=" * 80)
+    p("4. ТЕСТ ЗАГРУЗКИ КАТАЛОГА")
+    p("=" * 80)
 
     try:
-        catalog = await get_flat_catalog()
-
-        if catalog:
-            print(f"✅ Каталог загружен: {len(catalog)} товаров")
-            print(f"\nПример первого товара:")
-            if catalog:
-                first = catalog[0]
-                print(f"  Код товара: {first.get('item_code')}")
-                print(f"  Название: {first.get('item_name')}")
-                print(f"  Группа: {first.get('group_name')} ({first.get('group_code')})")
+        snapshot = await catalog_task
+        catalog = snapshot.df
+
+        if not catalog.empty:
+            p(f"✅ Каталог загружен: {len(catalog)} товаров")
+            p(f"\nПример первого товара:")
+            first = catalog.iloc[0]
+            p(f"  Код товара: {first.get('item_code')}")
+            p(f"  Название: {first.get('item_name')}")
+            p(f"  Группа: {first.get('group_name')} ({first.get('group_code')})")
         else:
-            print("❌ Каталог пуст (возможно 1C недоступна)")
+            p("❌ Каталог пуст (возможно, синхронизация из 1C еще не выполнялась)")
     except Exception as e:
-        print(f"❌ Ошибка: {e}")
-    print()
-
-
-async def test_search_in_catalog():
-    """Тест поиска в каталоге."""
-    print("=" * 80)
-    print("5. ТЕСТ ПОИСКА В КАТАЛОГЕ")
-    print("=" * 80)
-
-    queries = [
-        "вагонка 6 метров",
-        "брус 150x150",
-        "блок хаус класс АВ",
-    ]
-
-    for query in queries:
-        print(f"Запрос: '{query}'")
-        try:
-            results = await search_in_flat_catalog(query, limit=5)
-            print(f"  Найдено: {len(results)} товаров")
-
-            for i, item in enumerate(results[:3], 1):
-                score = item.get('score', 0)
-                name = item.get('item_name', '')
-                print(f"  {i}. [{score:.1f}] {name[:60]}...")
-        except Exception as e:
-            print(f"  ❌ Ошибка: {e}")
-        print()
-
-
-async def test_search_products_tool():
-    """Тест полного tool с ценами."""
-    print("=" * 80)
-    print("6. ТЕСТ SEARCH_PRODUCTS (ПОЛНЫЙ TOOL)")
-    print("=" * 80)
-
-    queries = [
-        SearchProductsRequest(query="вагонка 6 метров", limit=5, include_prices=True),
-        SearchProductsRequest(query="брус 150", limit=5, include_prices=False),
-    ]
-
-    for req in queries:
-        print(f"Запрос: '{req.query}' (с ценами: {req.include_prices})")
-        print("-" * 80)
-        try:
-            result = await search_products(req)
-            print(result)
-        except Exception as e:
-            print(f"❌ Ошибка: {e}")
-            import traceback
-            traceback.print_exc()
-        print()
+        p(f"❌ Ошибка: {e}")
+    p()
+    flush_output()
+
+
+# Запросы тестов 5 и 6
+SEARCH_QUERIES = [
+    "вагонка 6 метров",
+    "брус 150x150",
+    "блок хаус класс АВ",
+]
+TOOL_REQUESTS = [
+    {"query": "вагонка 6 метров", "limit": 5},
+    {"query": "брус 150", "limit": 5, "in_stock_only": True},
+]
+
+
+async def run_searches() -> list:
+    """Запросы SEARCH_QUERIES параллельно (ошибки - в списке результатов)."""
+    return await asyncio.gather(
+        *(asyncio.to_thread(search_products, ProductSearchParams(query=query, limit=5)) for query in SEARCH_QUERIES),
+        return_exceptions=True,
+    )
+
+
+async def run_tool_requests() -> list:
+    """Вызовы tool с TOOL_REQUESTS параллельно (ошибки - в списке результатов)."""
+    return await asyncio.gather(
+        *(asyncio.to_thread(search_products_tool.invoke, request) for request in TOOL_REQUESTS),
+        return_exceptions=True,
+    )
+
+
+async def test_search_in_catalog(results_list: list):
+    """Тест поиска в каталоге (результаты run_searches)."""
+    p("=" * 80)
+    p("5. ТЕСТ ПОИСКА В КАТАЛОГЕ")
+    p("=" * 80)
+
+    for query, results in zip(SEARCH_QUERIES, results_list):
+        p(f"Запрос: '{query}'")
+        if isinstance(results, Exception):
+            p(f"  ❌ Ошибка: {results}")
+            p()
+            continue
+
+        p(f"  Найдено: {len(results)} товаров")
+        for i, item in enumerate(results[:3], 1):
+            score = item.get('bm25_score', 0)
+            name = str(item.get('item_name', ''))
+            p(f"  {i}. [{score:.1f}] {name[:60]}...")
+        p()
+    flush_output()
+
+
+async def test_search_products_tool(results: list):
+    """Тест полного tool (результаты run_tool_requests)."""
+    p("=" * 80)
+    p("6. ТЕСТ SEARCH_PRODUCTS_TOOL (ПОЛНЫЙ TOOL)")
+    p("=" * 80)
+
+    for request, result in zip(TOOL_REQUESTS, results):
+        p(f"Запрос: {request}")
+        p("-" * 80)
+        if isinstance(result, Exception):
+            p(f"❌ Ошибка: {result!r}")
+        else:
+            p(result)
+        p()
+    flush_output()
 
 
 async def main():
     """Запуск всех тестов."""
-    print("\n")
-    print("╔" + "=" * 78 + "╗")
-    print("║" + " " * 20 + "ТЕСТИРОВАНИЕ SEARCH_PRODUCTS" + " " * 30 + "║")
-    print("╚" + "=" * 78 + "╝")
-    print()
-
-    # Тесты без async
-    await test_normalize_query()
-    await test_extract_keywords()
-    await test_scoring()
-
-    # Тесты с async (требуют Redis и 1C)
-    print("=" * 80)
-    print("ТЕСТЫ С РЕАЛЬНЫМИ ДАННЫМИ (требуют Redis и 1C)")
-    print("=" * 80)
-    print()
-
-    await test_get_flat_catalog()
-    await test_search_in_catalog()
-    await test_search_products_tool()
-
-    print("=" * 80)
-    print("ТЕСТИРОВАНИЕ ЗАВЕРШЕНО")
-    print("=" * 80)
+    p("\n")
+    p("╔" + "=" * 78 + "╗")
+    p("║" + " " * 20 + "ТЕСТИРОВАНИЕ SEARCH_PRODUCTS" + " " * 30 + "║")
+    p("╚" + "=" * 78 + "╝")
+    p()
+    flush_output()
+
+    # Загрузка каталога из Redis идет в фоне, пока выполняются тесты без Redis
+    catalog_task = asyncio.create_task(asyncio.to_thread(load_catalog_snapshot))
+
+    # Тесты без Redis: независимы друг от друга
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(test_normalize_query())
+        tg.create_task(test_extract_keywords())
+        tg.create_task(test_scoring())
+    if RUN_PERF_TESTS:
+        await test_scoring_synthetic()
+
+    # Тесты с реальными данными (требуют Redis с синхронизированным каталогом)
+    p("=" * 80)
+    p("ТЕСТЫ С РЕАЛЬНЫМИ ДАННЫМИ (требуют Redis)")
+    p("=" * 80)
+    p()
+
+    # Дожидаемся загрузки каталога: тесты поиска пользуются уже прогретым снимком
+    await test_get_flat_catalog(catalog_task)
+    # Поиски тестов 5 и 6 независимы - выполняются параллельно, вывод - по порядку
+    search_results, tool_results = await asyncio.gather(run_searches(), run_tool_requests())
+    await test_search_in_catalog(search_results)
+    await test_search_products_tool(tool_results)
+
+    p("=" * 80)
+    p("ТЕСТИРОВАНИЕ ЗАВЕРШЕНО")
+    p("=" * 80)
+    flush_output()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        # uvloop (ставится вместе с uvicorn[standard]) - более быстрый цикл событий
+        from uvloop import run
+    except ImportError:
+        run = asyncio.run
+    run(main())